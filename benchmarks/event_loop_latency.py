@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Measures how long cold lookups in a memory-mapped hash set stall an asyncio event loop…
+
+with plain membership tests on the one hand and through 'hashset.aio' on the
+other, for hash sets of both picklers since the 'string' pickler scans
+buckets in place while the 'pickle' pickler decodes them into the bucket
+cache. A ticker task asks to be woken up at a fixed interval and records by
+how much it's late while another task probes random items, yielding to the
+event loop after each. The hash set file is evicted from the page cache
+before each run where the platform supports it.
+"""
+
+import sys, os, time, random, asyncio, tempfile, argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hashset
+from hashset.aio import async_hashset
+
+
+picklers = ('pickle', 'string')
+
+
+def build( path, count, seed, pickler_name='pickle' ):
+	rng = random.Random(seed)
+	if pickler_name == 'string':
+		from hashset.picklers import codec_pickler
+		_set = hashset.hashset(dict(pickler=codec_pickler('utf-8', int_size=1)))
+	else:
+		_set = hashset.hashset()
+	_set.update('{:032x}'.format(rng.getrandbits(128)) for _ in range(count))
+	with open(path, 'wb') as f:
+		_set.to_file(f)
+	return list(_set)
+
+
+def evict( path ):
+	advise = getattr(os, 'posix_fadvise', None)
+	if advise is not None:
+		fd = os.open(path, os.O_RDONLY)
+		try:
+			advise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+		finally:
+			os.close(fd)
+
+
+async def ticker( interval, lags, done ):
+	loop = asyncio.get_running_loop()
+	while not done.is_set():
+		expected = loop.time() + interval
+		await asyncio.sleep(interval)
+		lags.append(loop.time() - expected)
+
+
+async def run( probe, needles, interval ):
+	lags = []
+	done = asyncio.Event()
+	task = asyncio.ensure_future(ticker(interval, lags, done))
+	start = time.perf_counter()
+	for needle in needles:
+		await probe(needle)
+		await asyncio.sleep(0)
+	elapsed = time.perf_counter() - start
+	done.set()
+	await task
+	return elapsed, sorted(lags)
+
+
+def report( name, elapsed, lags ):
+	def percentile( p ):
+		return lags[min(int(len(lags) * p), len(lags) - 1)] * 1e3 if lags else 0
+
+	print('{:<14} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}'.format(
+		name, elapsed, percentile(0.5), percentile(0.99), percentile(1)))
+
+
+def main( args ):
+	ap = argparse.ArgumentParser(description=__doc__.split('…')[0])
+	ap.add_argument('--items', type=int, default=200000,
+		help='The number of items in the hash set. (default: %(default)d)')
+	ap.add_argument('--probes', type=int, default=2000,
+		help='The number of lookups per run. (default: %(default)d)')
+	ap.add_argument('--interval', type=float, default=1,
+		help='The ticker interval in milliseconds. (default: %(default)s)')
+	ap.add_argument('--picklers', type=lambda s: s.split(','), default=list(picklers),
+		help='A comma-separated list of picklers out of: {}. (default: all)'
+			.format(', '.join(picklers)))
+	ap.add_argument('--seed', type=int, default=0)
+	args = ap.parse_args(args)
+
+	interval = args.interval / 1e3
+	print('{:<14} {:>9} {:>9} {:>9} {:>9}'.format(
+		'mode', 'total/s', 'p50/ms', 'p99/ms', 'max/ms'))
+
+	with tempfile.TemporaryDirectory(prefix='hashset-bench-') as tmp:
+		path = os.path.join(tmp, 'set.hashset')
+		for pickler_name in args.picklers:
+			rng = random.Random(args.seed)
+			items = build(path, args.items, args.seed, pickler_name)
+			needles = [ rng.choice(items) for _ in range(args.probes) ]
+
+			async def sync_run():
+				with hashset.hashset(path, cache='lru') as _set:
+					async def probe( needle ):
+						return needle in _set
+					return await run(probe, needles, interval)
+
+			async def async_run():
+				async with async_hashset(path, cache='lru') as _set:
+					return await run(_set.contains, needles, interval)
+
+			for name, func in (('sync', sync_run), ('async', async_run)):
+				evict(path)
+				report('{}/{}'.format(name, pickler_name), *asyncio.run(func()))
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
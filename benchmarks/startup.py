@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Measures the start-up time of the command-line entry points…
+
+as the median wall-clock time of some invocations that probe a single item
+and the cumulative import times that 'python3 -X importtime' reports for the
+top-level modules. Each entry point probes a file with the 'pickle' pickler
+and one with a UTF-8 string pickler whose codec it bypasses. An invocation
+that fails aborts the benchmark.
+"""
+
+import sys, os, re, time, statistics, subprocess, tempfile, argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hashset
+from hashset.picklers import codec_pickler
+
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_import_line = re.compile(r'^import time:\s*(\d+) \|\s*(\d+) \| (\S+)$')
+
+
+# An item of every hash set file, since probes that find nothing fail.
+_item = '1'
+
+
+def commands( paths ):
+	"""Returns the commands to measure by name for hash set files by pickler name."""
+	cmds = {
+		'python': [ sys.executable, '-c', 'pass' ],
+		'import': [ sys.executable, '-c', 'import hashset' ],
+	}
+	for name, path in paths.items():
+		cmds['probe-' + name] = [ sys.executable, '-m', 'hashset.probe',
+			'--encoding', 'utf-8', path, _item ]
+		cmds['cli-probe-' + name] = [ sys.executable, '-m', 'hashset',
+			'--encoding', 'utf-8', '--probe', path, _item ]
+	return cmds
+
+
+def wall_time( cmd, repeat ):
+	env = dict(os.environ, PYTHONPATH=_root)
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, check=True)
+		times.append(time.perf_counter() - start)
+	return statistics.median(times)
+
+
+def import_times( cmd ):
+	"""Returns the cumulative import times (in seconds) of the top-level modules imported by a command."""
+	env = dict(os.environ, PYTHONPATH=_root)
+	result = subprocess.run(cmd[:1] + ['-X', 'importtime'] + cmd[1:], env=env,
+		stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True,
+		universal_newlines=True)
+	times = {}
+	for line in result.stderr.splitlines():
+		m = _import_line.match(line)
+		if m is not None:
+			times[m.group(3)] = int(m.group(2)) / 1e6
+	return times
+
+
+def run( repeat=20, top=5 ):
+	"""Returns the measurements for every command by name."""
+	with tempfile.TemporaryDirectory(prefix='hashset-bench-') as tmp:
+		paths = {}
+		for name, header_args in (
+			('pickle', None),
+			('string', dict(pickler=codec_pickler('utf-8', int_size=1))),
+		):
+			paths[name] = os.path.join(tmp, name + '.hashset')
+			_set = hashset.hashset(header_args)
+			_set.update(map(str, range(1000)))
+			with open(paths[name], 'wb') as f:
+				_set.to_file(f)
+
+		results = {}
+		for name, cmd in commands(paths).items():
+			imports = import_times(cmd)
+			results[name] = {
+				'wall_time': wall_time(cmd, repeat),
+				'import_time': sum(imports.values()),
+				'slowest_imports': dict(sorted(
+					imports.items(), key=lambda item: item[1], reverse=True)[:top]),
+			}
+		return results
+
+
+def main( args ):
+	ap = argparse.ArgumentParser(description=__doc__.split('…')[0])
+	ap.add_argument('--repeat', type=int, default=20,
+		help='The number of invocations per command. (default: %(default)d)')
+	args = ap.parse_args(args)
+
+	print('{:<17} {:>10} {:>10}  {}'.format(
+		'command', 'wall/ms', 'import/ms', 'slowest top-level imports'))
+	for name, r in run(args.repeat).items():
+		print('{:<17} {:>10.1f} {:>10.1f}  {}'.format(
+			name, r['wall_time'] * 1e3, r['import_time'] * 1e3,
+			', '.join('{} {:.1f}'.format(k, v * 1e3)
+				for k, v in r['slowest_imports'].items())))
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
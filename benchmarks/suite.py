@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""A reproducible performance benchmark suite that emits JSON…
+
+for synthetic corpora of several sizes and item shapes, each built with
+several picklers and hash algorithms. It measures the build time and peak
+RSS (in a separate process per build), the file size, the open latency, the
+throughput of probing hits and misses, the p50 and p99 probe latency and the
+dump throughput. The start-up time of the command-line entry points (see
+'startup.py') may be included as well.
+
+The 'compare' command reports the relative change of every measurement
+between two result files, e. g. of two commits.
+"""
+
+import sys, os, gc, json, time, random, string, platform, resource
+import itertools, statistics, subprocess, tempfile, argparse
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _root)
+import hashset
+
+
+shapes = ('hex', 'words', 'urls', 'ints')
+picklers = ('string', 'pickle')
+
+# Corpora above this size are built out of core, which requires the 'string'
+# pickler (see 'hashset.builder').
+_max_in_memory = 1000000
+
+
+def make_items( shape, count, seed ):
+	"""Returns an iterator over 'count' distinct synthetic items of a given shape."""
+
+	rng = random.Random(seed)
+	if shape == 'hex':
+		# Distinct by construction: a counter mixed with random bits.
+		return (
+			'{:08x}{:024x}'.format(i, rng.getrandbits(96)) for i in range(count))
+	if shape == 'words':
+		letters = string.ascii_lowercase
+		return (
+			''.join(rng.choice(letters) for _ in range(rng.randint(3, 12))) +
+				format(i, 'x')
+			for i in range(count))
+	if shape == 'urls':
+		hosts = [ 'https://{}.example.{}/'.format(
+				''.join(rng.choice(string.ascii_lowercase) for _ in range(8)), tld)
+			for tld in ('com', 'org', 'net') for _ in range(16) ]
+		return (
+			'{}{}/{:x}'.format(rng.choice(hosts), rng.choice(('a', 'b', 'doc')), i)
+			for i in range(count))
+	if shape == 'ints':
+		return map(str, range(seed * count, (seed + 1) * count))
+	raise ValueError('Unknown item shape {!r}'.format(shape))
+
+
+def write_corpus( path, shape, count, seed ):
+	with open(path, 'w', encoding='utf-8') as f:
+		for item in make_items(shape, count, seed):
+			f.write(item)
+			f.write('\n')
+
+
+def build( corpus_path, out_path, pickler_name, hash_name ):
+	"""Builds a hash set file from a corpus file and returns the peak RSS (in bytes) of this process."""
+
+	from hashset.picklers import codec_pickler, pickle_proxy
+	from hashset.hashers import hashlib_proxy, pyhash_proxy
+
+	hasher = (
+		hashlib_proxy if hash_name in hashlib_proxy.algorithms_available else
+		pyhash_proxy)(hash_name)
+
+	with open(corpus_path, encoding='utf-8') as f:
+		count = 0
+		max_len = 0
+		for line in f:
+			count += 1
+			max_len = max(max_len, len(line.rstrip().encode('utf-8')))
+		f.seek(0)
+		items = map(str.rstrip, f)
+
+		if pickler_name == 'pickle':
+			import pickle
+			_set = hashset.hashset(
+				dict(hasher=hasher, pickler=pickle_proxy(pickle)))
+		else:
+			pickler = codec_pickler('utf-8')
+			pickler.int_size = pickler.get_int_size_for_val(max_len)
+			_set = (
+				hashset.builder(dict(hasher=hasher, pickler=pickler),
+					memory_limit=256 << 20)
+				if count > _max_in_memory else
+				hashset.hashset(dict(hasher=hasher, pickler=pickler)))
+		_set.update(items)
+
+		with open(out_path, 'wb') as f_out:
+			_set.to_file(f_out)
+		if hasattr(_set, 'release'):
+			_set.release()
+
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux reports KiB, macOS bytes.
+	return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _percentile( values, p ):
+	return values[min(int(len(values) * p), len(values) - 1)] if values else None
+
+
+def measure( path, hits, misses, repeat ):
+	"""Returns the read-side measurements of a hash set file."""
+
+	open_times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		hashset.hashset(path).release()
+		open_times.append(time.perf_counter() - start)
+
+	result = { 'open_latency': statistics.median(open_times) }
+	with hashset.hashset(path) as _set:
+		for name, needles in (('hit', hits), ('miss', misses)):
+			expected = len(needles) if name == 'hit' else 0
+			gc.disable()
+			try:
+				start = time.perf_counter()
+				found = sum(map(_set.__contains__, needles))
+				elapsed = time.perf_counter() - start
+			finally:
+				gc.enable()
+			if found != expected:
+				raise AssertionError('{:d} of {:d} {} needles found, expected {:d}'
+					.format(found, len(needles), name, expected))
+			result[name + '_throughput'] = len(needles) / elapsed if elapsed else None
+
+		latencies = []
+		clock = time.perf_counter_ns
+		for needle in hits + misses:
+			start = clock()
+			needle in _set
+			latencies.append(clock() - start)
+		latencies.sort()
+		result['probe_latency_p50'] = _percentile(latencies, 0.5) / 1e9
+		result['probe_latency_p99'] = _percentile(latencies, 0.99) / 1e9
+
+		start = time.perf_counter()
+		count = sum(1 for _ in _set)
+		elapsed = time.perf_counter() - start
+		result['dump_throughput'] = count / elapsed if elapsed else None
+
+	return result
+
+
+def default_hashes():
+	from hashset.hashers import pyhash_proxy
+	return ['md5', 'sha1'] + [
+		a for a in pyhash_proxy.algorithms_preferred
+		if a in pyhash_proxy.algorithms_available ]
+
+
+def run( sizes, shapes, picklers, hashes, probes=10000, repeat=20, seed=0,
+	log=None
+):
+	"""Runs the benchmarks and returns the list of results."""
+
+	results = []
+	with tempfile.TemporaryDirectory(prefix='hashset-bench-') as tmp:
+		for size in sizes:
+			for shape in shapes:
+				corpus_path = os.path.join(tmp, 'corpus.txt')
+				write_corpus(corpus_path, shape, size, seed)
+				rng = random.Random(seed)
+				with open(corpus_path, encoding='utf-8') as f:
+					hits = rng.sample(list(map(str.rstrip, f)), min(probes, size))
+				misses = list(itertools.islice(make_items(shape, size, seed + 1), len(hits)))
+				if shape == 'words':
+					# Make sure that they differ from every item in the corpus.
+					misses = [ m + '-' for m in misses ]
+
+				for pickler_name in picklers:
+					if pickler_name == 'pickle' and size > _max_in_memory:
+						continue
+					for hash_name in hashes:
+						if log is not None:
+							print('{:d} {} {} {}'.format(size, shape, pickler_name, hash_name),
+								file=log, flush=True)
+
+						out_path = os.path.join(tmp, 'set.hashset')
+						start = time.perf_counter()
+						worker = subprocess.run(
+							[ sys.executable, os.path.abspath(__file__), 'build',
+								corpus_path, out_path, pickler_name, hash_name ],
+							stdout=subprocess.PIPE, check=True, universal_newlines=True)
+						build_time = time.perf_counter() - start
+
+						result = {
+							'size': size, 'shape': shape, 'pickler': pickler_name,
+							'hash': hash_name, 'build_time': build_time,
+							'peak_rss': json.loads(worker.stdout)['peak_rss'],
+							'file_size': os.path.getsize(out_path),
+						}
+						result.update(measure(out_path, hits, misses, repeat))
+						results.append(result)
+						os.unlink(out_path)
+
+	return results
+
+
+def _commit():
+	try:
+		return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=_root,
+			stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+			universal_newlines=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def compare( old, new, threshold=0.05 ):
+	"""Prints the relative change of every measurement that exceeds 'threshold' between two result documents."""
+
+	key = lambda r: (r['size'], r['shape'], r['pickler'], r['hash'])
+	old_results = { key(r): r for r in old['results'] }
+	for r in new['results']:
+		o = old_results.get(key(r))
+		if o is None:
+			continue
+		for metric, value in r.items():
+			before = o.get(metric)
+			if (isinstance(value, (int, float)) and isinstance(before, (int, float)) and
+				metric not in ('size',) and before and
+				abs(value / before - 1) > threshold
+			):
+				print('{:>9} {:<6} {:<7} {:<8} {:<20} {:>+8.1%}'.format(
+					*key(r), metric, value / before - 1))
+
+
+def main( args ):
+	ap = argparse.ArgumentParser(description=__doc__.split('…')[0])
+	sub = ap.add_subparsers(dest='command')
+
+	r = sub.add_parser('run', help='Run the benchmarks and write the results as JSON.')
+	r.add_argument('--sizes', type=lambda s: [ int(float(x)) for x in s.split(',') ],
+		default=[10000, 100000],
+		help='A comma-separated list of corpus sizes between 1e4 and 1e8. '
+			'(default: 1e4,1e5)')
+	r.add_argument('--shapes', type=lambda s: s.split(','), default=list(shapes),
+		help='A comma-separated list of item shapes out of: {}. (default: all)'
+			.format(', '.join(shapes)))
+	r.add_argument('--picklers', type=lambda s: s.split(','), default=list(picklers),
+		help='A comma-separated list of picklers out of: {}. (default: all)'
+			.format(', '.join(picklers)))
+	r.add_argument('--hashes', type=lambda s: s.split(','), default=None,
+		help="A comma-separated list of hash algorithms. (default: md5, sha1 and "
+			"the preferred ones of 'pyhash' that are available)")
+	r.add_argument('--probes', type=int, default=10000,
+		help='The number of hits and of misses to probe. (default: %(default)d)')
+	r.add_argument('--repeat', type=int, default=20,
+		help='The number of times to open each file. (default: %(default)d)')
+	r.add_argument('--seed', type=int, default=0)
+	r.add_argument('--startup', action='store_true',
+		help='Measure the start-up time of the command-line entry points, too.')
+	r.add_argument('-o', '--output', default='-',
+		help='The path of the JSON output. (default: standard output)')
+
+	c = sub.add_parser('compare',
+		help='Report the relative changes between two result files.')
+	c.add_argument('old')
+	c.add_argument('new')
+	c.add_argument('--threshold', type=float, default=0.05,
+		help='The smallest relative change to report. (default: %(default)s)')
+
+	b = sub.add_parser('build')
+	b.add_argument('corpus')
+	b.add_argument('out')
+	b.add_argument('pickler', choices=picklers)
+	b.add_argument('hash')
+
+	args = ap.parse_args(args)
+	if args.command == 'build':
+		json.dump({ 'peak_rss': build(args.corpus, args.out, args.pickler, args.hash) },
+			sys.stdout)
+	elif args.command == 'compare':
+		with open(args.old) as f_old, open(args.new) as f_new:
+			compare(json.load(f_old), json.load(f_new), args.threshold)
+	elif args.command == 'run':
+		doc = {
+			'commit': _commit(),
+			'python': platform.python_version(),
+			'platform': platform.platform(),
+			'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+			'parameters': {
+				'sizes': args.sizes, 'shapes': args.shapes, 'picklers': args.picklers,
+				'hashes': args.hashes or default_hashes(), 'probes': args.probes,
+				'repeat': args.repeat, 'seed': args.seed },
+		}
+		doc['results'] = run(
+			args.sizes, args.shapes, args.picklers, doc['parameters']['hashes'],
+			args.probes, args.repeat, args.seed, log=sys.stderr)
+		if args.startup:
+			import startup
+			doc['startup'] = startup.run()
+
+		if args.output == '-':
+			json.dump(doc, sys.stdout, indent=1)
+			print()
+		else:
+			with open(args.output, 'w') as f:
+				json.dump(doc, f, indent=1)
+	else:
+		ap.print_usage(sys.stderr)
+		sys.exit(2)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -34,4 +34,34 @@ printf '\n%s:\n' 'Probe (stdin)'
 printf '%s\n' "$@" | tac | "${p[@]}" --probe "$h" ||
 	rv=$(($rv | $?))
 
+h_utf8="$h.utf-8"
+printf '%s\n' foo ba{r,z} |
+"${p[@]}" --external-encoding=iso-8859-15 --internal-encoding=utf-8 \
+	--item-int-size=1 --pickler=string --build - "$h_utf8" ||
+exit
+
+declare -a probe=( env PYTHONPATH="$scriptdir${PYTHONPATH:+:$PYTHONPATH}" \
+	python3 -m hashset.probe --encoding=utf-8 )
+printf '\n%s:\n' 'Probe (lightweight entry point, command-line)'
+"${probe[@]}" "$h_utf8" "$@" ||
+	rv=$(($rv | $?))
+
+printf '\n%s:\n' 'Probe (lightweight entry point, stdin)'
+printf '%s\n' "$@" | tac | "${probe[@]}" "$h_utf8" ||
+	rv=$(($rv | $?))
+
+h_ooc="$h.out-of-core"
+printf '%s\n' foo ba{r,z} foo |
+env PYTHONPATH="$scriptdir${PYTHONPATH:+:$PYTHONPATH}" python3 -c '
+import sys, hashset
+with hashset.builder(memory_limit=16, jobs=2) as b:
+	b.update(map(str.rstrip, sys.stdin))
+	with open(sys.argv[1], "wb") as f:
+		b.to_file(f)' "$h_ooc" ||
+exit
+
+printf '\n%s:\n' 'Probe (out-of-core build, default pickler)'
+"${p[@]}" --probe "$h_ooc" "$@" ||
+	rv=$(($rv | $?))
+
 exit "$rv"
@@ -1,13 +1,16 @@
 """Build, read, and probe hashets to/from files."""
 
-import sys, os, mmap
+import sys, os, mmap, array
 import math, itertools, collections.abc
-import pickle
 import hashset.util, hashset.util.iter
 import hashset.util.functional as functional
+from functools import partial as fpartial
 from .header import header as hashset_header
 from .picklers import pickle_proxy, PickleError
-from .hashers import default_hasher
+from .cache import make_cache
+from .bloom import bloom_filter
+from .mph import mph_table
+from . import writer, delta, algebra, fingerprint
 from .util.math import is_pow2, ceil_pow2
 
 
@@ -17,11 +20,21 @@ class hashset:
 	Such a buff is typically backed by a memory-mapped file.
 	"""
 
-	_default_header_args = dict(
-		hasher=default_hasher, pickler=pickle_proxy(pickle))
+	@staticmethod
+	def _default_header_args():
+		import pickle
+		from .hashers import default_hasher
+		return dict(hasher=default_hasher, pickler=pickle_proxy(pickle))
+
+	advice_names = (
+		'normal', 'random', 'sequential', 'willneed', 'dontneed', 'hugepage',
+		'nohugepage')
 
 
-	def __init__( self, _from=None, load_factor=2/3 ):
+	def __init__( self, _from=None, load_factor=2/3, cache=None, deltas=(),
+		thread_safe=False, index_advice=(), value_advice=(), populate=False,
+		stats=False
+	):
 		"""Initialize a new hashset instance.
 
 		If '_from' is a buffer the hash set is built based on its content.
@@ -34,18 +47,60 @@ class hashset:
 
 		If '_from' is None (the default) the constructor chooses suitable default
 		values to build a new in-memory hash set.
+
+		'cache' selects how decoded buckets of a buffer-backed hash set are
+		retained: either a policy name ('none', 'lru' or 'unbounded', the
+		default) or a cache instance from 'hashset.cache'. It has no effect on
+		in-memory hash sets.
+
+		'deltas' is a sequence of delta logs (see 'hashset.delta'), given as path
+		names or binary file objects, that are applied in order. They're overlaid
+		on top of a buffer-backed hash set without modifying it and applied
+		directly to an in-memory hash set.
+
+		If 'thread_safe' is true, a buffer-backed hash set may be shared between
+		threads, e. g. to probe a single memory-mapping of a file from every
+		thread of a server: the bucket cache and the cache of decompressed blocks
+		are guarded by locks and the hash set is read-only, i. e. attempts to
+		modify it raise a ValueError. In-memory hash sets don't support this
+		mode.
+
+		'index_advice' and 'value_advice' are sequences (or comma-separated
+		strings) of names from 'advice_names' that are passed to 'madvise' for
+		the memory-mapping of a file: the former for everything in front of the
+		value section, i. e. the header, Bloom filter, displacement table and
+		bucket index, the latter for the value section. Advice that the platform
+		doesn't support is skipped. If 'populate' is true, the mapping is
+		populated up front ('MAP_POPULATE') or, where that's not available, the
+		whole mapping is advised 'willneed'. See also 'warm'.
+
+		If 'stats' is true, probes are counted and timed (see 'stats' and
+		'hashset.stats.probe_stats'). Otherwise they cost no more than a few
+		attribute tests.
 		"""
 
 		self.load_factor = load_factor
+		self._thread_safe = bool(thread_safe)
+		self._cache = None
+		self._bloom = None
+		self._mph = None
+		self._blocks = None
+		self._delta_added = None
+		self._delta_removed = None
+		self._stats = None
 
 		if _from is None or isinstance(_from, collections.abc.Mapping):
-			kwargs = self._default_header_args.copy()
+			kwargs = self._default_header_args()
 			if _from is not None: kwargs.update(_from)
 			pargs = (kwargs.pop('hasher'), kwargs.pop('pickler'))
 			self._header = hashset_header(*pargs, **kwargs)
+			if thread_safe:
+				raise ValueError(
+					'Only buffer-backed hash sets support the thread-safe mode')
 			self._buckets = []
+			self._entries = []
+			self._bucket_count = 0
 			self._size = 0
-			self._buckets_complete = True
 			self._hash_mask = 0
 
 			self._mmap = None
@@ -57,12 +112,12 @@ class hashset:
 			if isinstance(_from, str):
 				fd = os.open(_from, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
 				try:
-					_from = self._open_mmap(fd)
+					_from = self._open_mmap(fd, populate)
 				finally:
 					os.close(fd)
 			if isinstance(_from, int):
 				if 0 <= _from < 1<<31:
-					_from = self._open_mmap(_from)
+					_from = self._open_mmap(_from, populate)
 				else:
 					raise ValueError('Invalid file descriptor: {:d}'.format(_from))
 
@@ -70,20 +125,202 @@ class hashset:
 			self.buf = _from if isinstance(_from, memoryview) else memoryview(_from)
 			self._header = hashset_header.from_bytes(self.buf)
 			self._size = self._header.element_count
-			self._buckets = [None] * self._header.bucket_count
-			self._hash_mask = self._to_hash_mask(len(self._buckets))
-			self._buckets_complete = False
+			self._buckets = None
+			self._entries = None
+			self._bucket_count = self._header.bucket_count
+			self._cache = make_cache(cache, thread_safe)
+			if self._header.mph_buckets:
+				offset = self._header.mph_offset()
+				self._mph = mph_table(
+					self.buf[offset : offset + self._header.mph_size()]
+						.cast(mph_table.typecode_for(self._bucket_count)),
+					self._bucket_count)
+				self._hash_mask = None
+			else:
+				self._hash_mask = self._to_hash_mask(self._bucket_count)
 			self._value_offset = self._header.value_offset()
+			if self._header.bloom_bits_per_key:
+				offset = self._header.bloom_offset()
+				self._bloom = bloom_filter(
+					self.buf[offset : offset + self._header.bloom_size()],
+					self._header.bloom_bits_per_key)
 			self.buckets_idx = (
 				self.buf[self._header.index_offset : self._value_offset]
 					.cast('BHILQ'[self._header.int_size.bit_length() - 1]))
+			self._fingerprint_shift = fingerprint.shift_for(self._header)
+			if self._header.compression:
+				from .compression import block_reader
+				self._blocks = block_reader(
+					self.buf[self._value_offset:], self._header.compression,
+					thread_safe)
+				self._value_size = self._blocks.value_size
+			else:
+				self._value_size = len(self.buf) - self._value_offset
+
+			if populate and not hasattr(mmap, 'MAP_POPULATE'):
+				self._advise(('willneed',), 0, len(self.buf))
+			self._advise(index_advice, 0, self._value_offset)
+			self._advise(value_advice, self._value_offset, len(self.buf))
+
+		if stats:
+			from .stats import probe_stats
+			self._stats = probe_stats()
+
+		if deltas:
+			self._load_deltas(deltas)
+
+
+	def stats( self, reset=False ):
+		"""Returns the probe statistics of this hash set as a 'hashset.stats.probe_stats' instance…
+
+		that's reset afterwards if 'reset' is true. Raises a ValueError unless
+		the hash set was constructed with statistics enabled.
+		"""
+
+		if self._stats is None:
+			raise ValueError('This hash set doesn\'t collect statistics')
+		if reset:
+			import copy
+			stats = copy.copy(self._stats)
+			self._stats.reset()
+			return stats
+		return self._stats
+
+
+	def _load_deltas( self, deltas ):
+		"""Replays delta logs.
+
+		The overlay of a buffer-backed hash set only retains the additions of
+		items missing from the buffer (along with their bucket index) and the
+		removals of items present in it.
+		"""
+
+		added = {}
+		removed = set()
+		for op, key in itertools.chain.from_iterable(map(delta.read, deltas)):
+			if op == delta.ADD:
+				removed.discard(key)
+				added[key] = None
+			else:
+				added.pop(key, None)
+				removed.add(key)
+
+		if self.buf is None:
+			self.update(map(self._delta_decode, added))
+			util.iter.each(self.discard, map(self._delta_decode, removed))
+			return
+
+		for key in tuple(added):
+			obj = self._delta_decode(key)
+			if self._base_contains(obj):
+				del added[key]
+			else:
+				added[key] = self.get_bucket_idx_for(obj)
+		removed = set(itertools.compress(removed,
+			map(self._base_contains, map(self._delta_decode, removed))))
+
+		if added or removed:
+			self._delta_added = added
+			self._delta_removed = removed
+			self._size += len(added) - len(removed)
+
+
+	def _delta_key( self, obj ):
+		"""Returns the encoded form of an item that's stored in delta logs."""
+		pickler = self._header.pickler
+		return bytes(getattr(pickler, 'dump_single_convert', pickler.dump_single)(obj))
+
+
+	def _delta_decode( self, key ):
+		pickler = self._header.pickler
+		load = getattr(pickler, 'load_single_convert', None)
+		return pickler.load_single(key) if load is None else load(key, 0, len(key))
+
+
+	def _delta_contains( self, obj ):
+		"""Returns whether the delta overlay adds or removes an item, or None if it does neither."""
+		key = self._delta_key(obj)
+		if key in self._delta_added:
+			return True
+		if key in self._delta_removed:
+			return False
+		return None
+
+
+	def write_delta( self, file, added=(), removed=() ):
+		"""Appends the additions and removals of some items to a delta log opened in binary append mode."""
+		delta.append(file,
+			map(self._delta_key, added), map(self._delta_key, removed))
 
 
 	@staticmethod
-	def _open_mmap( fd ):
+	def _open_mmap( fd, populate=False ):
+		if populate and hasattr(mmap, 'MAP_POPULATE'):
+			return mmap.mmap(fd, 0, mmap.MAP_SHARED | mmap.MAP_POPULATE,
+				mmap.PROT_READ)
 		return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
 
 
+	def _advise( self, names, start, end ):
+		"""Passes advice to 'madvise' for a range of the memory-mapping, if any."""
+		if isinstance(names, str):
+			names = names.split(',') if names else ()
+		for name in names:
+			if name not in self.advice_names:
+				raise ValueError(
+					'Unknown advice {!r}, expected one of: {}'
+						.format(name, ', '.join(self.advice_names)))
+
+		if (self._mmap is None or not hasattr(self._mmap, 'madvise') or
+			start >= end
+		):
+			return
+		start -= start % mmap.PAGESIZE
+		for name in names:
+			advice = getattr(mmap, 'MADV_' + name.upper(), None)
+			if advice is not None:
+				try:
+					self._mmap.madvise(advice, start, end - start)
+				except OSError:
+					# E. g. 'hugepage' for file-backed mappings
+					pass
+
+
+	def warm( self, background=True, values=False ):
+		"""Touches every page of the memory-mapping in front of the value section…
+
+		i. e. of the header, Bloom filter, displacement table and bucket index,
+		and of the value section, too, if 'values' is true, so that later
+		lookups don't wait for them to be read from disk. If 'background' is
+		true, that happens in a daemon thread which is returned; it stops early if
+		the hash set is released in the meantime.
+		"""
+
+		if self.buf is None:
+			return None
+
+		end = len(self.buf) if values else self._value_offset
+		if background:
+			import threading
+			thread = threading.Thread(
+				target=self._touch, args=(end,), name='hashset-warm', daemon=True)
+			thread.start()
+			return thread
+
+		self._touch(end)
+		return None
+
+
+	def _touch( self, end ):
+		buf = self.buf
+		try:
+			for offset in range(0, end, mmap.PAGESIZE):
+				buf[offset]
+		except ValueError:
+			# The hash set was released.
+			pass
+
+
 	@staticmethod
 	def _to_hash_mask( bucket_count ):
 		if bucket_count >= 0 and is_pow2(bucket_count):
@@ -101,14 +338,123 @@ class hashset:
 
 	def __iter__( self ):
 		"""Returns an iterator over the entries of this hash set."""
-		for b in map(self.get_bucket, range(len(self._buckets))):
+		for b in filter(None, self._iter_buckets()):
 			yield from b
-		self._buckets_complete = True
 
 
 	def __contains__( self, obj ):
-		"""Tests if this hash set contains the given object."""
-		return obj in self.get_bucket_for(obj)
+		"""Tests if this hash set contains the given object.
+
+		A delta overlay is consulted first, then the Bloom filter if the hash set
+		has one.
+		"""
+
+		if self._delta_added is None and self._stats is None:
+			return self._base_contains(obj)
+
+		contained = (
+			None if self._delta_added is None else self._delta_contains(obj))
+		if contained is None:
+			contained = self._base_contains(obj)
+		if self._stats is not None:
+			self._stats.count(contained)
+		return contained
+
+
+	def _base_contains( self, obj ):
+		if not self._bucket_count:
+			return False
+		h = (self.header.hash(obj) if self._stats is None else
+			self._stats.timed_hash(self.header.hash, obj))
+		if self._bloom is not None and h not in self._bloom:
+			if self._stats is not None:
+				self._stats.bloom_rejects += 1
+			return False
+		return self._bucket_contains(self._bucket_idx_for_hash(h), obj, h)
+
+
+	def contains_many( self, needles, items=False ):
+		"""Tests the membership of many objects at once.
+
+		Needles that the delta overlay doesn't decide are hashed up front, checked
+		against the Bloom filter if there is one, and grouped by their bucket
+		index. The groups are visited in ascending bucket order which, since the
+		bucket index is monotonic, walks the backing buffer front to back.
+
+		Returns a list of booleans in the order of 'needles' or, if 'items' is
+		true, the list of contained needles in that same order.
+		"""
+
+		if not isinstance(needles, collections.abc.Sequence):
+			needles = tuple(needles)
+
+		mask = [False] * len(needles)
+		groups = collections.defaultdict(list)
+		for i, obj in enumerate(needles):
+			if self._delta_added is not None:
+				contained = self._delta_contains(obj)
+				if contained is not None:
+					mask[i] = contained
+					continue
+			if self._bucket_count:
+				h = (self.header.hash(obj) if self._stats is None else
+					self._stats.timed_hash(self.header.hash, obj))
+				if self._bloom is None or h in self._bloom:
+					groups[self._bucket_idx_for_hash(h)].append((i, h))
+				elif self._stats is not None:
+					self._stats.bloom_rejects += 1
+
+		for n in sorted(groups):
+			for i, h in groups[n]:
+				mask[i] = self._bucket_contains(n, needles[i], h)
+
+		if self._stats is not None:
+			self._stats.count_many(mask)
+
+		return list(itertools.compress(needles, mask)) if items else mask
+
+
+	def probe_parallel( self, needles, workers=None, batch_size=1024,
+		items=False
+	):
+		"""Tests the membership of many objects in batches spread over a pool of threads.
+
+		The batches of up to 'batch_size' needles are probed with
+		'contains_many' by up to 'workers' threads (by default as many as
+		'concurrent.futures.ThreadPoolExecutor' would use). Only a bounded
+		number of batches are pending at any time, so 'needles' may be a long
+		stream. A buffer-backed hash set needs to be in the thread-safe mode.
+
+		Returns an iterator over booleans in the order of 'needles' or, if
+		'items' is true, over the contained needles in that same order.
+		"""
+
+		if self.buf is not None and not self._thread_safe:
+			raise ValueError(
+				'Only thread-safe buffer-backed hash sets can be probed in parallel')
+		if batch_size <= 0:
+			raise ValueError('Non-positive batch size: {:d}'.format(batch_size))
+		if workers is None:
+			workers = min(32, (os.cpu_count() or 1) + 4)
+		elif workers <= 0:
+			raise ValueError('Non-positive worker count: {:d}'.format(workers))
+
+		return self._iter_probe_parallel(
+			util.iter.chunked(needles, batch_size), workers, items)
+
+
+	def _iter_probe_parallel( self, batches, workers, items ):
+		import concurrent.futures
+
+		probe = fpartial(self.contains_many, items=items)
+		with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+			pending = collections.deque()
+			for batch in batches:
+				if len(pending) >= 2 * workers:
+					yield from pending.popleft().result()
+				pending.append(executor.submit(probe, batch))
+			while pending:
+				yield from pending.popleft().result()
 
 
 	def get_bucket( self, n ):
@@ -117,28 +463,124 @@ class hashset:
 		A bucket is either a sequence or a set of entries.
 		"""
 
-		bucket = self._buckets[n]
-		if bucket is None:
-			if self.buf is None:
+		if self.buf is None:
+			bucket = self._buckets[n]
+			if bucket is None:
 				bucket = []
-			else:
-				offset = self.buckets_idx[n]
-				length = (
-					util.getitem(self.buckets_idx, n + 1,
-						len(self.buf) - self._value_offset) - offset)
-				if length > 0:
-					bucket = (
-						self.header.pickler.load_bucket(
-							self.buf, self._value_offset + offset, length))
-				else:
-					assert length == 0
-					bucket = ()
+				self._buckets[n] = bucket
+			return bucket
 
-			self._buckets[n] = bucket
+		bucket = self._cache.get(n)
+		if bucket is None:
+			bucket, length = self._load_bucket(n)
+			self._cache.put(n, bucket, length)
 
 		return bucket
 
 
+	def _load_bucket( self, n ):
+		"""Decodes the bucket at a given index of 'buf' and returns it along with its encoded length."""
+		buf, offset, length = self._bucket_buffer(n)
+		if length > 0:
+			size = self._header.fingerprint_size
+			if size:
+				offset, length = fingerprint.split(buf, offset, length, size)[1:]
+			if self._stats is not None:
+				return self._stats.timed_decode(
+					self.header.pickler.load_bucket, buf, offset, length), length
+			return self.header.pickler.load_bucket(buf, offset, length), length
+		return (), length
+
+
+	def _bucket_fingerprints( self, n ):
+		"""Returns the stored fingerprints of the entries of the bucket at a given index."""
+		buf, offset, length = self._bucket_buffer(n)
+		if not length:
+			return ()
+		return fingerprint.split(buf, offset, length, self._header.fingerprint_size)[0]
+
+
+	def _peek_bucket( self, n ):
+		"""Like 'get_bucket' for buffer-backed hash sets but doesn't offer decoded buckets to the cache."""
+		bucket = self._cache.get(n)
+		return self._load_bucket(n)[0] if bucket is None else bucket
+
+
+	def _bucket_extent( self, n ):
+		"""Returns the offset and length of the encoded bucket at a given index relative to the (uncompressed) value section."""
+		offset = self.buckets_idx[n]
+		length = util.getitem(self.buckets_idx, n + 1, self._value_size) - offset
+		assert length >= 0
+		return offset, length
+
+
+	def _bucket_buffer( self, n ):
+		"""Returns a buffer with the encoded bucket at a given index and its offset and length in that buffer.
+
+		That's either 'buf' or, if the value section is compressed, the
+		decompressed block that contains the bucket.
+		"""
+
+		offset, length = self._bucket_extent(n)
+		if not length:
+			return self.buf, 0, 0
+		if self._blocks is None:
+			return self.buf, self._value_offset + offset, length
+		block, offset = self._blocks.locate(offset)
+		return block, offset, length
+
+
+	def _bucket_contains( self, n, obj, h=None ):
+		"""Tests if the bucket at a given index contains an object.
+
+		For buckets that weren't decoded yet, the stored fingerprints are
+		compared to that of the object's hash 'h' (computed on demand) first, if
+		there are any. Then the bucket is scanned in place if the pickler
+		supports it, i. e. the object is encoded once and compared to the encoded
+		bucket entries without decoding them.
+		"""
+
+		stats = self._stats
+		bucket = None if self.buf is None else self._cache.get(n)
+		if bucket is None and self.buf is not None:
+			buf, offset, length = self._bucket_buffer(n)
+			if not length:
+				return False
+
+			size = self._header.fingerprint_size
+			if size:
+				if h is None:
+					h = (self.header.hash(obj) if stats is None else
+						stats.timed_hash(self.header.hash, obj))
+				fingerprints, offset, length = fingerprint.split(
+					buf, offset, length, size)
+				if fingerprint.of(h, size, self._fingerprint_shift) not in fingerprints:
+					if stats is not None:
+						stats.fingerprint_rejects += 1
+					return False
+
+			pickler = self.header.pickler
+			bucket_contains = getattr(pickler, 'bucket_contains', None)
+			if bucket_contains is not None:
+				try:
+					needle = pickler.dump_single_convert(obj)
+				except (TypeError, ValueError):
+					pass
+				else:
+					if stats is not None:
+						stats.in_place_scans += 1
+						stats.bytes_scanned += length
+					return bucket_contains(buf, offset, length, needle)
+
+		if bucket is None:
+			bucket = self.get_bucket(n)
+		elif stats is not None:
+			stats.cache_hits += 1
+		if stats is not None:
+			stats.count_compared(bucket, obj)
+		return obj in bucket
+
+
 	def get_bucket_for( self, obj ):
 		"""Returns the bucket for the given object."""
 		return self.get_bucket(self.get_bucket_idx_for(obj))
@@ -146,16 +588,112 @@ class hashset:
 
 	def get_bucket_idx_for( self, obj ):
 		"""Returns the bucket index for the given object."""
-		return self.header.hash(obj) & self._hash_mask
+		return self._bucket_idx_for_hash(self.header.hash(obj))
+
+
+	def _bucket_idx_for_hash( self, h ):
+		"""Returns the bucket index for a hash.
+
+		With a minimal perfect hash table, each bucket holds exactly one item.
+		"""
+		if self._mph is None:
+			return h & self._hash_mask
+		return self._mph.slot(h)
 
 
 	@property
 	def buckets( self ):
-		"""The list of buckets backing this hash set."""
-		if not self._buckets_complete:
-			util.iter.each(self.get_bucket, range(self.header.bucket_count))
-			self._buckets_complete = True
-		return self._buckets
+		"""The list of buckets backing this hash set.
+
+		For buffer-backed hash sets this decodes all buckets into a new list.
+		"""
+		if self.buf is None:
+			return self._buckets
+		return list(map(self.get_bucket, range(self._bucket_count)))
+
+
+	def _iter_buckets( self ):
+		"""Returns an iterator over all buckets without decoding them up front.
+
+		The buckets of a buffer-backed hash set include its delta overlay. They
+		aren't retained in the bucket cache so that a full pass doesn't flood it.
+		"""
+		if self.buf is None:
+			return iter(self._buckets)
+		buckets = map(self._peek_bucket, range(self._bucket_count))
+		if self._delta_added is not None:
+			added = collections.defaultdict(list)
+			for key, n in self._delta_added.items():
+				added[n].append(self._delta_decode(key))
+			buckets = map(fpartial(self._overlay_bucket, added),
+				itertools.count(), buckets)
+		return buckets
+
+
+	def _overlay_bucket( self, added, n, bucket ):
+		if self._delta_removed:
+			bucket = [ item for item in bucket
+				if self._delta_key(item) not in self._delta_removed ]
+		return list(itertools.chain(bucket, added.get(n, ())))
+
+
+	def union_to_file( self, file, *others, bloom_bits_per_key=0 ):
+		"""Writes the union of this and other hash sets to a file…
+
+		in a single pass over the buckets of each. All hash sets must share the
+		same hasher, pickler and bucket count (see 'hashset.algebra'). Returns
+		the number of items written.
+		"""
+		return algebra.write(
+			file, (self,) + others, algebra.union, bloom_bits_per_key)
+
+
+	def intersection_to_file( self, file, *others, bloom_bits_per_key=0 ):
+		"""Like 'union_to_file' but writes the intersection of all hash sets."""
+		return algebra.write(
+			file, (self,) + others, algebra.intersection, bloom_bits_per_key)
+
+
+	def difference_to_file( self, file, *others, bloom_bits_per_key=0 ):
+		"""Like 'union_to_file' but writes the items of this hash set that are in none of the others."""
+		return algebra.write(
+			file, (self,) + others, algebra.difference, bloom_bits_per_key)
+
+
+	def isdisjoint( self, other ):
+		"""Tests if this and another hash set have no items in common.
+
+		If both share the same hasher, pickler and bucket count, corresponding
+		buckets are compared one at a time; otherwise every item of this hash set
+		is looked up in the other.
+		"""
+		if self._is_compatible(other):
+			return algebra.isdisjoint((self, other))
+		return not any(map(other.__contains__, self))
+
+
+	def issubset( self, other ):
+		"""Tests if every item of this hash set is in another (see 'isdisjoint')."""
+		if self._is_compatible(other):
+			return algebra.issubset((self, other))
+		return all(map(other.__contains__, self))
+
+
+	def issuperset( self, other ):
+		"""Tests if every item of another hash set is in this one (see 'isdisjoint')."""
+		if self._is_compatible(other):
+			return algebra.issubset((other, self))
+		return all(map(self.__contains__, other))
+
+
+	def _is_compatible( self, other ):
+		if not isinstance(other, hashset):
+			return False
+		try:
+			algebra.check_compatible((self, other))
+		except ValueError:
+			return False
+		return True
 
 
 	def add( self, obj ):
@@ -164,22 +702,30 @@ class hashset:
 
 
 	def _add_impl( self, obj ):
-		bucket = self.get_bucket_for(obj)
+		self._detach()
+		h = self.header.hash(obj)
+		n = self._bucket_idx_for_hash(h)
+		bucket = self.get_bucket(n)
 		if obj in bucket:
 			return False
 		else:
+			self._get_entries(n).append(self._make_entry(obj, h))
 			bucket.append(obj)
 			self._size += 1
 			return True
 
 
 	def discard( self, obj ):
-		bucket = self.get_bucket_for(obj)
+		self._detach()
+		n = self.get_bucket_idx_for(obj)
+		bucket = self.get_bucket(n)
 		try:
-			bucket.remove(obj)
+			i = bucket.index(obj)
 		except ValueError:
 			return False
 
+		del self._get_entries(n)[i]
+		del bucket[i]
 		self._size -= 1
 		return True
 
@@ -192,9 +738,11 @@ class hashset:
 
 	def pop( self ):
 		if self._size:
+			self._detach()
 			self._size -= 1
-			return next(iter(filter(bool,
-				map(self.get_bucket, range(self.header.bucket_count))))).pop()
+			n = next(itertools.compress(itertools.count(), self._buckets))
+			self._get_entries(n).pop()
+			return self._buckets[n].pop()
 		else:
 			raise KeyError('empty set')
 
@@ -233,44 +781,141 @@ class hashset:
 			self.load_factor = load_factor
 
 		required_buckets = math.ceil(max(size, 0) / self.load_factor)
-		if required_buckets > len(self._buckets):
+		if required_buckets > self._bucket_count:
 			self._rehash(required_buckets)
 
 
+	def _detach( self ):
+		"""Loads a buffer-backed hash set into memory so that it can be modified."""
+		if self.buf is not None:
+			self._rehash(self._bucket_count, force=True)
+
+
 	def _rehash( self, bucket_count, force=False ):
+		if self._thread_safe:
+			raise ValueError('Cannot modify a thread-safe hash set')
 		if bucket_count > 0:
 			bucket_count = ceil_pow2(bucket_count)
 		elif bucket_count < 0:
 			raise ValueError('Negative bucket count')
 		elif self._size:
 			raise ValueError('Zero bucket count for non-empty element set')
-		if not force and bucket_count == len(self._buckets):
+		if not force and bucket_count == self._bucket_count:
 			return
 
 		hash_mask = self._to_hash_mask(bucket_count)
 		buckets = [None] * bucket_count
-		for item in self:
-			i = self.header.hash(item) & hash_mask
-			bucket = buckets[i]
-			if bucket is None:
-				bucket = []
-				buckets[i] = bucket
-			bucket.append(item)
+		entries = [None] * bucket_count
+		if self.buf is None:
+			# Re-mask the stored hashes.
+			for n, bucket in enumerate(self._buckets):
+				if bucket:
+					for item, entry in zip(bucket, self._get_entries(n)):
+						i = entry[0] & hash_mask
+						if buckets[i] is None:
+							buckets[i] = []
+							entries[i] = []
+						buckets[i].append(item)
+						entries[i].append(entry)
+		else:
+			# The entries of buckets read from a buffer are computed on demand.
+			for i, item in self._iter_rehashed(hash_mask):
+				bucket = buckets[i]
+				if bucket is None:
+					bucket = []
+					buckets[i] = bucket
+				bucket.append(item)
 
 		self.release()
 		self._mmap = None
 		self.buf = None
-		self.value_offset = None
+		self._value_offset = None
 		self.buckets_idx = None
+		self._cache = None
+		self._bloom = None
+		self._mph = None
+		self._blocks = None
+		self._delta_added = None
+		self._delta_removed = None
 		self._buckets = buckets
+		self._entries = entries
+		self._bucket_count = bucket_count
 		self._hash_mask = hash_mask
 
 
+	def _make_entry( self, obj, h=None ):
+		"""Returns the hash of an item and its converted form (see 'writer.make_entries')."""
+		if h is None:
+			h = self._header.hash(obj)
+		convert = getattr(self._header.pickler, 'dump_single_convert', None)
+		return h, (None if convert is None else convert(obj))
+
+
+	def _get_entries( self, n ):
+		"""Returns the list of hashes and converted forms of the items in the in-memory bucket at a given index…
+
+		which is kept in parallel to the bucket so that items are hashed and
+		converted only once. It's computed on demand.
+		"""
+
+		entries = self._entries[n]
+		if entries is None:
+			entries = list(map(self._make_entry, self.get_bucket(n)))
+			self._entries[n] = entries
+		return entries
+
+
+	def _iter_entry_buckets( self, hashes=True ):
+		"""Returns an iterator over all buckets as lists of entries (see 'writer.make_entries').
+
+		The stored hashes and converted forms of in-memory buckets are reused;
+		those of buffer-backed buckets are computed, the hashes only if 'hashes'
+		is true.
+		"""
+
+		if self.buf is None:
+			return (
+				[ (item,) + entry for item, entry in zip(b, self._get_entries(n)) ]
+					if b else ()
+				for n, b in enumerate(self._buckets))
+		return map(fpartial(writer.make_entries, self.header, hashes=hashes),
+			self._iter_buckets())
+
+
+	def _iter_rehashed( self, hash_mask ):
+		"""Returns an iterator over the bucket indices for a hash mask and the items of this buffer-backed hash set.
+
+		Buffer-backed hash sets with hash buckets reuse the bucket index of their
+		items if the hash mask doesn't grow and their stored fingerprints if the
+		added hash bits are among them. Otherwise the items are hashed again.
+		"""
+
+		old_mask = self._hash_mask
+		if self.buf is not None and self._mph is None:
+			if hash_mask <= old_mask:
+				return (
+					(n & hash_mask, item)
+					for n, bucket in enumerate(self._iter_buckets())
+					for item in bucket)
+
+			size = self._header.fingerprint_size
+			shift = old_mask.bit_length()
+			if (size and self._delta_added is None and
+				hash_mask >> shift < 1 << (size * 8)
+			):
+				return (
+					(n | (fp << shift) & hash_mask, item)
+					for n, bucket in enumerate(self._iter_buckets())
+					for fp, item in zip(self._bucket_fingerprints(n), bucket))
+
+		return ((self.header.hash(item) & hash_mask, item) for item in self)
+
+
 	@property
 	def header( self ):
 		"""Returns the header object used to build the file header for this hash set."""
 		self._header.element_count = self._size
-		self._header.bucket_count = len(self._buckets)
+		self._header.bucket_count = self._bucket_count
 		return self._header
 
 
@@ -281,10 +926,16 @@ class hashset:
 		upon exit.
 		"""
 
+		buckets = self._buckets if self._cache is None else self._cache.values()
 		util.iter.each(memoryview.release,
 			filter(functional.instance_tester(memoryview), itertools.chain(
-				itertools.chain.from_iterable(filter(bool, self._buckets)),
-				(self.buckets_idx, self.buf))))
+				itertools.chain.from_iterable(filter(bool, buckets)),
+				(self.buckets_idx, self._bloom and self._bloom.buf,
+					self._mph and self._mph.displacements, self.buf))))
+		if self._blocks is not None:
+			self._blocks.release()
+		if self._cache is not None:
+			self._cache.clear()
 		if self._mmap is not None:
 			self._mmap.close()
 
@@ -297,28 +948,144 @@ class hashset:
 		return False
 
 
-	def to_file( self, file ):
+	def to_file( self, file, sorted_buckets=None, bloom_bits_per_key=None,
+		mph=None, compression=None, block_size=1<<16, fingerprint_size=None
+	):
 		"""Writes this hash set to a file or buffer-like object
 
 		in a way that allows later retrieval from the same buffer through the
-		class constructor."""
+		class constructor.
+
+		If 'sorted_buckets' is not None, it overrides the bucket layout of the
+		pickler (see 'bytes_pickler').
+
+		If 'bloom_bits_per_key' is not None, it overrides the size of the Bloom
+		filter section that precedes the bucket index; 0 omits the section.
+
+		If 'mph' is true, the buckets are replaced with the slots of a minimal
+		perfect hash table over all items (see 'hashset.mph') that hold exactly
+		one item each. If it's None (the default), the layout of a buffer-backed
+		hash set is retained.
+
+		If 'compression' is not None, it overrides the codec (see
+		'hashset.compression') that compresses the value section in blocks of
+		about 'block_size' bytes; an empty string disables compression.
+
+		If 'fingerprint_size' is not None, it overrides the size (in bytes, see
+		'hashset.fingerprint.sizes') of the hash fingerprints stored along with
+		each item; 0 omits them.
+		"""
+
+		if mph is None:
+			mph = self._mph is not None
+		elif not mph and self._mph is not None:
+			self._detach()
+		if self.buf is not None and (
+			(sorted_buckets is not None and
+				bool(sorted_buckets) !=
+					getattr(self.header.pickler, 'sorted_buckets', None)) or
+			(fingerprint_size is not None and
+				fingerprint_size != self.header.fingerprint_size)
+		):
+			# The buckets are decoded with the layout of the header and the pickler.
+			self._detach()
+
+		if sorted_buckets is not None:
+			pickler = self.header.pickler
+			if not hasattr(pickler, 'sorted_buckets'):
+				raise ValueError(
+					'The pickler {!r} doesn\'t support sorted buckets'.format(pickler))
+			pickler.sorted_buckets = bool(sorted_buckets)
+			self.header.reevaluate()
+		if bloom_bits_per_key is not None:
+			self.header.bloom_bits_per_key = bloom_bits_per_key
+		if compression is not None:
+			if compression:
+				from .compression import get_codec
+				get_codec(compression)
+			self.header.compression = compression or None
+		if fingerprint_size is not None:
+			if fingerprint_size and fingerprint_size not in fingerprint.sizes:
+				raise ValueError(
+					'Unsupported fingerprint size: {:d}'.format(fingerprint_size))
+			self.header.fingerprint_size = fingerprint_size
 
 		self.header.run_estimates(self)
 
+		header = self.header
+		with_hashes = bool(
+			mph or header.fingerprint_size or header.bloom_bits_per_key)
+		table = None
+		if mph:
+			entries = list(itertools.chain.from_iterable(
+				self._iter_entry_buckets()))
+			table, owners = mph_table.build([ e[1] for e in entries ])
+			buckets = lambda: ([entries[i]] for i in owners)
+			shift = 0
+		else:
+			entries = None
+			buckets = fpartial(self._iter_entry_buckets, with_hashes)
+			shift = max(self._bucket_count.bit_length() - 1, 0)
+
+		hashes = None
+		sizing_buckets = buckets
+		if with_hashes and entries is None and self.buf is not None:
+			# Hash the decoded items only in the first pass and keep their hashes
+			# for the Bloom filter and the fingerprints (like 'builder._make_run').
+			hashes = array.array('Q')
+			sizing_buckets = lambda: writer.record_hashes(
+				self._iter_entry_buckets(), hashes)
+			buckets = lambda: writer.restore_hashes(
+				self._iter_entry_buckets(False), hashes)
+
+		encode = fpartial(writer.encode_entries, header, shift)
+
+		# Encode every bucket once just to learn its size so that the buckets can
+		# be streamed to the file afterwards, one at a time, in a second pass.
+		# A resumable pickling error therefore only restarts the cheap first pass.
 		while True:
 			try:
-				buckets = list(util.iter.iconditional(
-					self.buckets, bool, self.header.pickler.dump_bucket, b''))
+				sizes = array.array('Q', util.iter.iconditional(
+					sizing_buckets(), bool,
+					functional.comp(len, encode), 0))
 				break
 			except PickleError as err:
 				if err.can_resume:
-					header.reevaluate()
+					self.header.reevaluate()
 				else:
 					raise err
 
-		file.write(self.header.to_bytes(None, buckets))
-		if buckets:
-			util.iter.each(file.write, itertools.chain(
-				map(self.header.int_to_bytes,
-					util.iter.accumulate(map(len, util.iter.islice(buckets, -1)), 0)),
-				buckets))
+		bloom = None
+		if header.bloom_bits_per_key:
+			bloom = bloom_filter.build(
+				hashes if hashes is not None else
+					(e[1] for e in (entries if entries is not None else
+						itertools.chain.from_iterable(buckets()))),
+				self._size, header.bloom_bits_per_key)
+
+		value_size = sum(sizes)
+		if header.int_size and value_size.bit_length() > 8 * header.int_size:
+			# E. g. fingerprints outgrew the index integer size of a loaded file
+			header.int_size = 0
+
+		if table is not None and table.slot_count:
+			header.bucket_count = table.slot_count
+			header.mph_buckets = len(table.displacements)
+		else:
+			table = None
+			header.mph_buckets = 0
+
+		writer.write(file, header, sizes,
+			map(encode, filter(bool, buckets())),
+			value_size, bloom, table, block_size)
+
+
+def __getattr__( name ):
+	# The builder and its dependencies are only imported on demand.
+	if name == 'builder':
+		from .builder import builder
+		globals()['builder'] = builder
+		return builder
+
+	raise AttributeError(
+		'module {!r} has no attribute {!r}'.format(__name__, name))
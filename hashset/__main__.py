@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 import sys, os
-import math, operator, collections
+import math, operator, itertools, collections
 import hashset
 import hashset.util as util
 import hashset.util.io as util_io
@@ -25,7 +25,7 @@ class ActionHelper:
 			self.can_bypass_codec = False
 
 		if self.can_bypass_codec:
-			self.linesep = self.pickler.dump_single_convert(linesep)
+			self.linesep = self.encode(linesep)
 			self.encoding = 'binary'
 			self.open_flags = 'b'
 		else:
@@ -33,9 +33,14 @@ class ActionHelper:
 			self.open_flags = 't'
 
 
+	def encode( self, s ):
+		"""Encodes a string with the codec of the pickler if it's bypassed and returns it unchanged otherwise."""
+		return self.pickler.codec.encode(s)[0] if self.can_bypass_codec else s
+
+
 	def open( self, path, mode='r' ):
-		return util_io.open(
-			path, mode + self.open_flags, encoding=self.encoding)
+		return util_io.open(path, mode + self.open_flags,
+			encoding=None if self.can_bypass_codec else self.encoding)
 
 
 	def open_stdstream( self, name ):
@@ -51,44 +56,329 @@ class ActionHelper:
 		file.write(self.linesep)
 
 
-def build( in_path, out_path, **kwargs ):
+def build( in_path, out_path, memory_limit=0, jobs=1, **kwargs ):
 	ai = ActionHelper(kwargs)
-	_set = hashset.hashset(
-		dict(pickler=ai.pickler, hasher=kwargs['hash'].get_instance(),
-			int_size=kwargs['index_int_size']),
-		kwargs['load_factor'])
+	if kwargs['hash'] is None:
+		from .hashers import default_hasher as hasher
+	else:
+		hasher = kwargs['hash'].get_instance()
+	header_args = dict(pickler=ai.pickler, hasher=hasher,
+		int_size=kwargs['index_int_size'])
+
+	if memory_limit > 0 or jobs != 1:
+		if kwargs['mph']:
+			raise ValueError(
+				'A minimal perfect hash layout can\'t be built out of core')
+		builder_args = dict(
+			bloom_bits_per_key=kwargs['bloom_bits_per_key'], jobs=jobs,
+			compression=kwargs['compression'], block_size=kwargs['block_size'],
+			fingerprint_size=kwargs['fingerprint_size'])
+		if memory_limit > 0:
+			builder_args['memory_limit'] = memory_limit
+		ai.pickler.sorted_buckets = kwargs['sorted_buckets']
+		with hashset.builder(header_args, kwargs['load_factor'], **builder_args
+		) as _set:
+			with ai.open(in_path) as f_in:
+				_set.update(map(ai.strip_line, f_in))
+			with util_io.open(out_path, 'wb') as f_out:
+				_set.to_file(f_out)
+		return
+
+	_set = hashset.hashset(header_args, kwargs['load_factor'])
 	with ai.open(in_path) as f_in:
 		_set.update(map(ai.strip_line, f_in))
 	with util_io.open(out_path, 'wb') as f_out:
-		_set.to_file(f_out)
+		_set.to_file(f_out,
+			sorted_buckets=kwargs['sorted_buckets'] or None,
+			bloom_bits_per_key=kwargs['bloom_bits_per_key'] or None,
+			mph=kwargs['mph'], compression=kwargs['compression'],
+			block_size=kwargs['block_size'],
+			fingerprint_size=kwargs['fingerprint_size'] or None)
 
 
-def dump( in_path, **kwargs ):
-	with hashset.hashset(in_path) as _set:
+def _open_mapped( in_path, warm=False, index_advice=(), value_advice=(),
+	populate=False, **kwargs
+):
+	"""Opens a hash set file with the given memory-mapping options and warms it up if requested."""
+	_set = hashset.hashset(in_path, index_advice=index_advice,
+		value_advice=value_advice, populate=populate, **kwargs)
+	if warm:
+		_set.warm()
+	return _set
+
+
+def _pop_mapping_args( kwargs ):
+	return { k: kwargs.pop(k)
+		for k in ('warm', 'index_advice', 'value_advice', 'populate') }
+
+
+def _print_stats( _set ):
+	print(_set.stats().format(), file=sys.stderr)
+
+
+def dump( in_path, delta=(), stats=False, **kwargs ):
+	with _open_mapped(in_path, deltas=delta, stats=stats,
+		**_pop_mapping_args(kwargs)
+	) as _set:
 		ai = ActionHelper(kwargs, _set.header.pickler)
 		with ai.open_stdstream('stdout') as f_out:
 			util_iter.each(fpartial(ai.println, f_out), _set)
+		if stats:
+			_print_stats(_set)
 
 
-def probe( in_path, *needles, quiet=False, **kwargs ):
+def probe( in_path, *needles, quiet=False, batch_size=0, delta=(), workers=0,
+	stats=False, **kwargs
+):
 	import contextlib
 	with contextlib.ExitStack() as es:
-		_set = es.enter_context(hashset.hashset(in_path))
+		_set = es.enter_context(_open_mapped(in_path, deltas=delta,
+			thread_safe=workers > 0, stats=stats, **_pop_mapping_args(kwargs)))
+		if stats:
+			es.callback(_print_stats, _set)
 		ai = ActionHelper(kwargs, _set.header.pickler)
 
 		if needles:
 			if ai.can_bypass_codec:
-				needles = map(ai.pickler.dump_single_convert, needles)
+				needles = map(ai.encode, needles)
 		else:
 			needles = map(ai.strip_line,
 				es.enter_context(ai.open_stdstream('stdin')))
 
-		if quiet:
-			return any(map(_set.__contains__, needles))
+		if workers > 0:
+			contained = _set.probe_parallel(needles, workers,
+				batch_size if batch_size > 0 else 1024, items=not quiet)
+			if quiet:
+				return any(contained)
+		elif batch_size > 0:
+			batches = util_iter.chunked(needles, batch_size)
+			if quiet:
+				return any(itertools.chain.from_iterable(
+					map(_set.contains_many, batches)))
+			contained = itertools.chain.from_iterable(
+				map(fpartial(_set.contains_many, items=True), batches))
 		else:
-			return util_iter.each(
-				fpartial(ai.println, es.enter_context(ai.open_stdstream('stdout'))),
-				filter(_set.__contains__, needles))
+			if quiet:
+				return any(map(_set.__contains__, needles))
+			contained = filter(_set.__contains__, needles)
+
+		return util_iter.each(
+			fpartial(ai.println, es.enter_context(ai.open_stdstream('stdout'))),
+			contained)
+
+
+def analyze( in_path, load_factor=None, index_int_size=0, item_int_size=0,
+	**kwargs
+):
+	from . import analysis
+	with hashset.hashset(in_path, cache='none', index_advice=('sequential',)
+	) as _set:
+		a = analysis.analyze(_set)
+		# The current layout with the int sizes that the file actually uses
+		rows = [ ('(current)', analysis.estimate(_set, a, None,
+			_set.header.int_size, getattr(_set.header.pickler, 'int_size', 0))) ]
+		if not _set.header.mph_buckets:
+			# Load factors that lead to the same bucket count share a row.
+			rows_by_count = collections.OrderedDict()
+			for lf in sorted(set(analysis.load_factors) | {load_factor}):
+				r = analysis.estimate(_set, a, lf, index_int_size, item_int_size)
+				rows_by_count.setdefault(r['bucket_count'], ([], r))[0].append(
+					'{:.3g}'.format(lf))
+			rows.extend((', '.join(lfs), r) for lfs, r in rows_by_count.values())
+		header = _set.header
+		pickler = header.pickler
+
+	def percent( part, whole ):
+		return '{:.1%}'.format(part / whole) if whole else '-'
+
+	print('Items:              {:d}'.format(a['element_count']))
+	print('Buckets:            {:d} (load factor {})'.format(a['bucket_count'],
+		'-' if a['load_factor'] is None else '{:.3f}'.format(a['load_factor'])))
+	print('Empty buckets:      {:d} ({})'.format(
+		a['empty_buckets'], percent(a['empty_buckets'], a['bucket_count'])))
+	if a['sampled_buckets'] is not None:
+		print('Sampled buckets:    {:d} (bucket figures are estimates)'.format(
+			a['sampled_buckets']))
+	print('Index int size:     {:d}'.format(header.int_size))
+	print('Item int size:      {}'.format(getattr(pickler, 'int_size', '-')))
+	print('Chain bytes:        mean {:.1f}, {}, max {:d}'.format(
+		a['mean_chain_bytes'],
+		', '.join('p{:g} {}'.format(p * 100, '-' if v is None else v)
+			for p, v in a['chain_bytes_percentiles'].items()),
+		a['max_chain_bytes']))
+
+	print('\nChain bytes histogram (non-empty buckets):')
+	for k, count in a['chain_bytes_histogram'].items():
+		print('  {:>21} {:>12d} {:>7}'.format(
+			'{:d}-{:d}'.format(1 << (k - 1), (1 << k) - 1), count,
+			percent(count, a['bucket_count'])))
+	if a['entry_histogram']:
+		print('\nEntries per bucket:')
+		for k, count in a['entry_histogram'].items():
+			print('  {:>21d} {:>12d} {:>7}'.format(
+				k, count, percent(count, a['bucket_count'])))
+
+	print('\nSections:')
+	for name, size in a['sections'].items():
+		if size:
+			print('  {:<21} {:>12d} {:>7}'.format(
+				name, size, percent(size, a['file_size'])))
+	if a['value_size'] != a['sections']['values']:
+		print('  {:<21} {:>12d}'.format('values (uncompressed)', a['value_size']))
+	print('  {:<21} {:>12d}'.format('total', a['file_size']))
+
+	print('\nEstimates (index and item int sizes other than the current ones '
+		'default to the smallest suitable):')
+	print('  {:>16} {:>12} {:>6} {:>5} {:>5} {:>7} {:>8} {:>12} {:>12} {:>8}'
+		.format('load factor', 'buckets', 'fill', 'index', 'item', 'empty',
+			'entries', 'index bytes', 'file bytes', 'change'))
+	for label, r in rows:
+		print('  {:>16} {:>12d} {:>6} {:>5d} {:>5} {:>7} {:>8.2f} {:>12d} {:>12d} {:>8}'
+			.format(label, r['bucket_count'],
+				'-' if r['load_factor'] is None else '{:.3f}'.format(r['load_factor']),
+				r['index_int_size'],
+				'-' if r['item_int_size'] is None else r['item_int_size'],
+				'-' if r['empty_ratio'] is None else '{:.1%}'.format(r['empty_ratio']),
+				r['mean_chain_entries'], r['index_size'], r['file_size'],
+				'{:+.1%}'.format(r['file_size'] / a['file_size'] - 1)))
+
+
+def append_delta( in_path, delta_path, remove=False, **kwargs ):
+	with hashset.hashset(in_path) as _set:
+		ai = ActionHelper(kwargs, _set.header.pickler)
+		with ai.open_stdstream('stdin') as f_in, \
+			util_io.open(delta_path, 'ab') as f_out \
+		:
+			items = map(ai.strip_line, f_in)
+			_set.write_delta(f_out, *(((), items) if remove else (items,)))
+
+
+def compact( in_path, out_path, delta=(), **kwargs ):
+	import tempfile, stat
+	with hashset.hashset(in_path, deltas=delta) as _set:
+		pickler = _set.header.pickler
+		if isinstance(pickler, codec_pickler):
+			pickler.set_bypass_for(pickler.codec)
+
+		if out_path == '-':
+			with util_io.open(out_path, 'wb') as f_out:
+				_set.to_file(f_out)
+			return
+
+		# Readers of the old file keep their memory mapping while the new file is
+		# written next to it and then moved into place with the permissions of
+		# the file it replaces (or else those of the input file).
+		try:
+			mode = os.stat(out_path).st_mode
+		except FileNotFoundError:
+			mode = os.stat(in_path).st_mode
+		with tempfile.NamedTemporaryFile('wb',
+			dir=os.path.dirname(out_path) or None, prefix='.hashset-', delete=False
+		) as f_out:
+			try:
+				_set.to_file(f_out)
+				os.chmod(f_out.name, stat.S_IMODE(mode))
+			except BaseException:
+				f_out.close()
+				os.unlink(f_out.name)
+				raise
+		os.replace(f_out.name, out_path)
+
+
+def _open_bypassed( es, paths, deltas=() ):
+	"""Opens some hash set files whose codec picklers, if any, are put into bypass mode."""
+	sets = []
+	for path in paths:
+		_set = es.enter_context(hashset.hashset(path, deltas=deltas))
+		pickler = _set.header.pickler
+		if isinstance(pickler, codec_pickler):
+			pickler.set_bypass_for(pickler.codec)
+		sets.append(_set)
+	return sets
+
+
+def _combine( method, out_path, *in_paths, bloom_bits_per_key=0, **kwargs ):
+	import contextlib
+	with contextlib.ExitStack() as es:
+		first, *others = _open_bypassed(es, in_paths)
+		with util_io.open(out_path, 'wb') as f_out:
+			method(first, f_out, *others, bloom_bits_per_key=bloom_bits_per_key)
+
+
+def union( *args, **kwargs ):
+	_combine(hashset.hashset.union_to_file, *args, **kwargs)
+
+
+def intersection( *args, **kwargs ):
+	_combine(hashset.hashset.intersection_to_file, *args, **kwargs)
+
+
+def difference( *args, **kwargs ):
+	_combine(hashset.hashset.difference_to_file, *args, **kwargs)
+
+
+def isdisjoint( *in_paths, **kwargs ):
+	import contextlib
+	with contextlib.ExitStack() as es:
+		a, b = _open_bypassed(es, in_paths)
+		return a.isdisjoint(b)
+
+
+def issubset( *in_paths, **kwargs ):
+	import contextlib
+	with contextlib.ExitStack() as es:
+		a, b = _open_bypassed(es, in_paths)
+		return a.issubset(b)
+
+
+def serve( socket_path, *in_paths, delta=(), batch_size=0, framing='line',
+	**kwargs
+):
+	import contextlib
+	from .daemon import server
+	mapping_args = _pop_mapping_args(kwargs)
+	with contextlib.ExitStack() as es:
+		sets = []
+		decoders = []
+		for path in in_paths:
+			_set = es.enter_context(_open_mapped(path, deltas=delta,
+				thread_safe=True, **mapping_args))
+			ai = ActionHelper(dict(kwargs), _set.header.pickler)
+			sets.append(_set)
+			decoders.append(None if ai.can_bypass_codec else
+				fpartial(bytes.decode, encoding=ai.encoding))
+
+		server(sets, decoders, batch_size if batch_size > 0 else 1024, framing
+		).run(socket_path)
+
+
+def query( socket_path, *needles, quiet=False, framing='line',
+	external_encoding=None, **kwargs
+):
+	import contextlib
+	from .daemon import client
+	with contextlib.ExitStack() as es:
+		_client = es.enter_context(client(socket_path, framing, external_encoding))
+		linesep = os.linesep.encode(external_encoding)
+		if needles:
+			needles = [ item.encode(external_encoding) for item in needles ]
+		else:
+			needles = map(
+				fpartial(util_io.strip_line_terminator, linesep=linesep),
+				es.enter_context(util_io.open_stdstream('stdin', 'binary')))
+
+		if quiet:
+			return any(map(any, _client.contains_many(needles)))
+
+		needles, requests = itertools.tee(needles)
+		f_out = es.enter_context(util_io.open_stdstream('stdout', 'binary'))
+
+		def println( item ):
+			f_out.write(item)
+			f_out.write(linesep)
+
+		return util_iter.each(println, itertools.compress(
+			needles, map(any, _client.contains_many(requests))))
 
 
 def _parse_fraction( s, verifier=None ):
@@ -103,6 +393,26 @@ def _parse_fraction( s, verifier=None ):
 	raise ValueError('Illegal value {:f}, derived from {!r}'.format(x, s))
 
 
+def _parse_size( s ):
+	"""Parses a non-negative byte count with an optional binary unit suffix (K, M, G or T)."""
+	exp = 'KMGT'.find(s[-1:].upper()) + 1 if s else 0
+	if exp:
+		s = s[:-1]
+	n = int(s) << (10 * exp)
+	if n < 0:
+		raise ValueError('Negative size: {!r}'.format(s))
+	return n
+
+
+def _parse_advice( s ):
+	"""Parses a comma-separated list of names from 'hashset.advice_names'."""
+	names = tuple(s.split(',')) if s else ()
+	for name in names:
+		if name not in hashset.hashset.advice_names:
+			raise ValueError('Unknown advice: {!r}'.format(name))
+	return names
+
+
 class NamedMethod(collections.UserString):
 	def __init__( self, name, func ):
 		super().__init__(name)
@@ -136,8 +446,9 @@ class ArgumentChoice(collections.UserString):
 
 def make_argparse():
 	import argparse, locale, codecs
-	from .hashers import hashlib_proxy, pyhash_proxy, default_hasher
-	from .picklers import codec_pickler, pickle_proxy
+	from .hashers import hashlib_proxy, pyhash_proxy
+	from .picklers import (
+		codec_pickler, fixed_width_pickler, front_coded_pickler, pickle_proxy)
 
 	preferred_encoding = locale.getpreferredencoding()
 	ap = argparse.ArgumentParser(
@@ -164,12 +475,116 @@ def make_argparse():
 		help='Probe the existence of a list of items in a hash set. '
 			'The item list is either the list of positional command-line arguments '
 			'or, in their absence, read from standard input one item per line.')
+	actions.add_argument('--analyze',
+		nargs=1, metavar='HASHSET-FILE',
+		help='Report the bucket distribution of a hash set and the space taken by '
+			'its header, index and values, reading only the header and the bucket '
+			'index, and estimate the file size with other load factors (including '
+			'--load-factor) and with the smallest suitable --index-int-size and '
+			'--item-int-size unless given.')
+	actions.add_argument('--append-delta',
+		nargs=2, metavar=('HASHSET-FILE', 'DELTA-FILE'),
+		help='Append the items read from standard input, one per line, as '
+			'additions (or removals with --remove) to a delta file of a hash set. '
+			'See --delta.')
+	actions.add_argument('--compact',
+		nargs=2, metavar=('HASHSET-FILE', 'OUTPUT-FILE'),
+		help='Write a new hash set file from a hash set file and the delta files '
+			'given with --delta. The output file may be the same as the input; '
+			'it\'s replaced atomically. Since the application of delta files is '
+			'idempotent they may be removed afterwards at leisure.')
+
+	combine_help = ('Write the {} to OUTPUT-FILE in a single pass over the '
+		'buckets of each. The hash sets must share the same hasher, pickler and '
+		'bucket count.')
+	actions.add_argument('--union',
+		nargs='+', metavar=('OUTPUT-FILE', 'HASHSET-FILE'),
+		help=combine_help.format('union of the given hash sets'))
+	actions.add_argument('--intersection',
+		nargs='+', metavar=('OUTPUT-FILE', 'HASHSET-FILE'),
+		help=combine_help.format('intersection of the given hash sets'))
+	actions.add_argument('--difference',
+		nargs='+', metavar=('OUTPUT-FILE', 'HASHSET-FILE'),
+		help=combine_help.format(
+			'items of the first given hash set that are in none of the others'))
+	actions.add_argument('--isdisjoint',
+		nargs=2, metavar='HASHSET-FILE',
+		help='Report through the exit status whether two hash sets have no items '
+			'in common.')
+	actions.add_argument('--issubset',
+		nargs=2, metavar='HASHSET-FILE',
+		help='Report through the exit status whether every item of the first hash '
+			'set is in the second.')
+	actions.add_argument('--serve',
+		nargs='+', metavar=('SOCKET', 'HASHSET-FILE'),
+		help='Answer probe requests for the given hash sets on a UNIX domain '
+			'socket until interrupted. Each request is an item; each response has '
+			"one character per hash set, '1' if it contains the item and '0' "
+			'otherwise (see --framing). Concurrent requests are probed in batches '
+			'(see --batch-size, default 1024 here).')
+	actions.add_argument('--query',
+		nargs='+', metavar=('SOCKET', 'ITEM'),
+		help='Probe the existence of a list of items in the hash sets served on a '
+			'UNIX domain socket (see --serve) and print those found in any of them. '
+			'The item list is taken as with --probe.')
 
 	opt = ap.add_argument_group('Optional Arguments')
 	opt.add_argument('-q', '--quiet',
 		action='store_true', default=False,
 		help="Don't print matched items; only report success through the exit "
 			'status.')
+	opt.add_argument('--delta', metavar='DELTA-FILE',
+		action='append', default=[],
+		help='Overlay the additions and removals recorded in a delta file on the '
+			'hash set file when dumping, probing or compacting it. May be given '
+			'multiple times; later files take precedence.')
+	opt.add_argument('--remove',
+		action='store_true', default=False,
+		help='Record removals instead of additions with --append-delta.')
+	opt.add_argument('--batch-size', metavar='N',
+		type=int, default=0,
+		help='Probe items in batches of N that are grouped by bucket, so that the '
+			'hash set file is read mostly sequentially. The output order is '
+			'unaffected. (default: 0, i. e. probe one item at a time)')
+	opt.add_argument('--workers', metavar='N',
+		type=int, default=0,
+		help='Probe batches of items (see --batch-size, default 1024 here) with N '
+			'threads that share the hash set file. The output order is unaffected. '
+			'(default: 0, i. e. probe in the main thread)')
+	opt.add_argument('--advise-index', metavar='ADVICE[,...]',
+		dest='index_advice', default='',
+		type=NamedMethod('advice', _parse_advice),
+		help='Pass advice to madvise for the memory-mapping of the header, Bloom '
+			'filter and bucket index of a hash set file when dumping, probing or '
+			'serving it; a comma-separated list of: {}. Advice that the platform '
+			"doesn't support is skipped. (default: none)"
+				.format(', '.join(hashset.hashset.advice_names)))
+	opt.add_argument('--advise-values', metavar='ADVICE[,...]',
+		dest='value_advice', default='',
+		type=NamedMethod('advice', _parse_advice),
+		help='Like --advise-index but for the value section, e. g. \'random\' for '
+			'scattered lookups or \'sequential\' for dumps. (default: none)')
+	opt.add_argument('--populate',
+		action='store_true', default=False,
+		help='Read the entire hash set file into memory up front when mapping it '
+			'(MAP_POPULATE where available).')
+	opt.add_argument('--warm',
+		action='store_true', default=False,
+		help='Touch the header, Bloom filter and bucket index of a hash set file '
+			'in the background right after opening it.')
+	opt.add_argument('--stats',
+		action='store_true', default=False,
+		help='Count and time the work done by --probe or --dump, e. g. hashing, '
+			'bucket decoding and the entries compared, and write the statistics to '
+			'standard error afterwards.')
+	opt.add_argument('--framing',
+		# Literal copies of the constants of 'compression', 'fingerprint' and
+		# 'daemon' keep those modules out of the start-up.
+		choices=('line', 'length'), default='line',
+		help="The framing of the requests and responses of --serve and --query; "
+			"either 'line' for lines terminated by a line feed or 'length' for "
+			'byte sequences prefixed with their length as a 4-byte little-endian '
+			'integer. (default: line)')
 	opt.add_argument('--encoding', '--external-encoding', metavar='CHARSET',
 		dest='external_encoding', default=preferred_encoding,
 		help='The external encoding when reading or writing text. (default: {})'
@@ -192,6 +607,47 @@ def make_argparse():
 		type=int, metavar='N', default=0,
 		help='The size (in bytes) of the integers used to store the length of the '
 			'(encoded) hash set items. (default: 0, i. e. determine optimal value)')
+	p.add_argument('--memory-limit', metavar='SIZE',
+		type=NamedMethod('size', _parse_size), default=0,
+		help='Build the hash set out of core: buffer at most about SIZE bytes of '
+			'items (with an optional K, M, G or T suffix) in memory and spill the '
+			'rest to temporary files. Requires the \'string\' pickler. '
+			'(default: 0, i. e. build in memory)')
+	p.add_argument('-j', '--jobs', metavar='N',
+		type=int, default=1,
+		help='Hash, encode and partition the items in N worker processes; 0 '
+			'means one per CPU. Implies an out-of-core build (see '
+			'--memory-limit) if N is not 1. (default: 1)')
+	p.add_argument('--sorted-buckets',
+		action='store_true', default=False,
+		help='Store the entries of each bucket in sorted order along with an '
+			'offset table, so that lookups can binary-search a bucket instead of '
+			'scanning it. This pays off for large load factors.')
+	p.add_argument('--mph',
+		action='store_true', default=False,
+		help='Address the items through a minimal perfect hash function instead '
+			'of hash buckets, so that a lookup reads exactly one item. Takes longer '
+			'to build, in memory only.')
+	p.add_argument('--compression', metavar='CODEC',
+		choices=('zlib', 'bz2', 'lzma'),
+		help='Compress the items in blocks with one of the codecs zlib, bz2, '
+			'lzma. This trades CPU time during lookups for a smaller file. '
+			'(default: no compression)')
+	p.add_argument('--block-size', metavar='SIZE',
+		type=NamedMethod('size', _parse_size), default=64<<10,
+		help='The approximate amount of (uncompressed) data per compressed block, '
+			'with an optional K, M, G or T suffix. (default: 64K)')
+	p.add_argument('--fingerprint-size', metavar='N',
+		type=int, choices=(0, 1, 2), default=0,
+		help='Store N bytes of each item\'s hash along with it, so that most '
+			'lookups of absent items skip the comparison of the bucket entries and '
+			'a hash set can be re-bucketed without hashing its items again. '
+			'(default: 0, i. e. no fingerprints)')
+	p.add_argument('--bloom-bits-per-key', metavar='N',
+		type=int, default=0,
+		help='Add a Bloom filter with N bits per item in front of the bucket index '
+			'that rejects most absent items before their bucket is read. '
+			'(default: 0, i. e. no Bloom filter)')
 	default_load_factor = 0.75
 	p.add_argument('--load-factor', metavar='FRACTION',
 		type=NamedMethod('float or fraction',
@@ -202,10 +658,17 @@ def make_argparse():
 				.format(default_load_factor))
 
 
+	def pickle_instance( **kwargs ):
+		import pickle
+		return pickle_proxy(pickle)
+
+
 	class PicklerChoice(ArgumentChoice):
 		choices = {
 			'string': codec_pickler.string_instance,
-			'pickle': lambda **kwargs: pickle_proxy(pickle)
+			'fixed': fixed_width_pickler.string_instance,
+			'front-coded': front_coded_pickler.string_instance,
+			'pickle': pickle_instance
 		}
 	PicklerChoice.update_choices(util.as_tuple, 'string')
 	p.add_argument('--pickler',
@@ -213,34 +676,53 @@ def make_argparse():
 		choices=PicklerChoice.choices.values(),
 		default=PicklerChoice.default,
 		help='''The "pickler" used to encode hash set items; either 'string'
-			encoding for strings (default) or the 'pickle' encoding working on a
-			wide array of Python objects.''')
+			encoding for strings (default), 'fixed' for strings that all encode to
+			the same number of bytes, e. g. hexadecimal digests, 'front-coded' for
+			strings with common prefixes, e. g. URLs, or the 'pickle' encoding
+			working on a wide array of Python objects.''')
 
 
 	class HashChoice(ArgumentChoice):
 		def get_instance( self ):
 			return super().get_instance(self.data)
 
-		choices = { a: hashlib_proxy for a in hashlib_proxy.algorithms_available }
-		choices.update(
-			(a, pyhash_proxy) for a in pyhash_proxy.algorithms_available)
-	HashChoice.update_choices(util.as_tuple, default_hasher.name)
+		@classmethod
+		def lookup( cls, name ):
+			# Only look into 'pyhash', which is slow to import, if 'hashlib' doesn't
+			# provide the algorithm.
+			for proxy in (hashlib_proxy, pyhash_proxy):
+				if name in proxy.algorithms_available:
+					return cls(name, proxy)
+			raise argparse.ArgumentTypeError(
+				'unknown hash algorithm: {!r}'.format(name))
+
 	p.add_argument('--hash', metavar='ALGORITHM',
-		type=fpartial(dict.get, HashChoice.choices),
-		choices=HashChoice.choices.values(), default=HashChoice.default,
-		help='The hash algorithm used to assign items to buckets. (default: {})'
-			.format(HashChoice.default))
+		type=HashChoice.lookup, default=None,
+		help='The hash algorithm used to assign items to buckets, one of those '
+			"provided by 'hashlib' or 'pyhash'. (default: the first of {} that "
+			"'pyhash' provides or else md5)"
+				.format(', '.join(pyhash_proxy.algorithms_preferred)))
 
 	return ap
 
 
 def main( args ):
-	import pickle
-	pickle.DEFAULT_PROTOCOL = pickle.HIGHEST_PROTOCOL
-
-	kwargs = vars(make_argparse().parse_args(args))
-
-	actions = [build, dump, probe]
+	ap = make_argparse()
+	kwargs = vars(ap.parse_args(args))
+	for name in ('union', 'intersection', 'difference'):
+		if kwargs[name] is not None and len(kwargs[name]) < 2:
+			ap.error('argument --{}: expected OUTPUT-FILE and at least one '
+				'HASHSET-FILE'.format(name))
+	if (kwargs['build'] is not None and
+		(kwargs['memory_limit'] > 0 or kwargs['jobs'] != 1) and
+		not kwargs['item_int_size'] and
+		kwargs['pickler'].data in ('string', 'front-coded')
+	):
+		ap.error('argument --item-int-size: required to build out of core (see '
+			'--memory-limit and --jobs)')
+
+	actions = [build, dump, probe, analyze, append_delta, compact,
+		union, intersection, difference, isdisjoint, issubset, serve, query]
 	action_args = None
 	while actions and action_args is None:
 		action = actions.pop()
@@ -249,6 +731,10 @@ def main( args ):
 		map(operator.attrgetter('__name__'), actions))
 	del actions
 
+	if action in (build, compact, union, intersection, difference):
+		import pickle
+		pickle.DEFAULT_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
 	rv = action(*action_args, **kwargs)
 	if rv is None:
 		rv = 0
@@ -0,0 +1,166 @@
+"""Membership tests on hash sets from asyncio code without blocking the event loop."""
+
+import asyncio, itertools
+from . import hashset
+from .cache import lru_cache
+
+
+class async_hashset:
+	"""Wraps a hash set for use from coroutines.
+
+	Lookups that can be answered from memory, i. e. those in in-memory hash
+	sets, those decided by the delta overlay and those in buckets that are
+	already in the bucket cache or were probed recently, are answered right
+	away. The others may have to wait for page faults on the memory-mapping or
+	the decompression of a block, so they're passed to 'executor' (by default
+	that of the event loop). Since most picklers scan buckets in place without
+	decoding them into the bucket cache, the indices of the last 'hot_buckets'
+	buckets probed in the executor are remembered as well; their pages are
+	most likely still resident. Hash sets with a minimal perfect hash layout are
+	always probed in the executor since their displacement table is part of
+	the mapping, too.
+
+	'_set' is either a hash set, which must be in the thread-safe mode if it's
+	buffer-backed, or a path name or file descriptor that is opened with the
+	additional keyword arguments in the thread-safe mode and released along with
+	this instance.
+	"""
+
+	def __init__( self, _set, executor=None, hot_buckets=1<<12, **kwargs ):
+		if isinstance(_set, hashset):
+			if _set.buf is not None and not _set._thread_safe:
+				raise ValueError(
+					'Only thread-safe buffer-backed hash sets can be probed from an '
+					'executor')
+			self._owned = False
+		else:
+			_set = hashset(_set, thread_safe=True, **kwargs)
+			self._owned = True
+
+		self.set = _set
+		self.executor = executor
+		# Only touched from the event loop.
+		self._hot = lru_cache(hot_buckets)
+
+
+	def __len__( self ):
+		return len(self.set)
+
+
+	async def contains( self, obj ):
+		"""Tests the membership of an object."""
+		_set = self.set
+		if _set.buf is None:
+			return obj in _set
+
+		contained = (
+			None if _set._delta_added is None else _set._delta_contains(obj))
+		if contained is None:
+			contained = await self._base_contains(obj)
+		if _set._stats is not None:
+			_set._stats.count(contained)
+		return contained
+
+
+	async def _base_contains( self, obj ):
+		_set = self.set
+		if not _set._bucket_count:
+			return False
+
+		h = (_set.header.hash(obj) if _set._stats is None else
+			_set._stats.timed_hash(_set.header.hash, obj))
+		if _set._mph is None:
+			n = _set._bucket_idx_for_hash(h)
+			if self._is_hot(n):
+				return _set._bucket_contains(n, obj, h)
+		else:
+			n = None
+
+		contained = await asyncio.get_running_loop().run_in_executor(
+			self.executor, self._cold_contains, obj, h, n)
+		if n is not None:
+			self._hot.put(n, True)
+		return contained
+
+
+	async def contains_many( self, needles, items=False ):
+		"""Tests the membership of many objects at once.
+
+		The cold lookups among them are passed to the executor in a single batch
+		in ascending bucket order (see 'hashset.contains_many').
+
+		Returns a list of booleans in the order of 'needles' or, if 'items' is
+		true, the list of contained needles in that same order.
+		"""
+
+		_set = self.set
+		needles = tuple(needles)
+		if _set.buf is None:
+			return _set.contains_many(needles, items)
+
+		mask = [False] * len(needles)
+		cold = []
+		for i, obj in enumerate(needles):
+			if _set._delta_added is not None:
+				contained = _set._delta_contains(obj)
+				if contained is not None:
+					mask[i] = contained
+					continue
+			if _set._bucket_count:
+				h = (_set.header.hash(obj) if _set._stats is None else
+					_set._stats.timed_hash(_set.header.hash, obj))
+				if _set._mph is None:
+					n = _set._bucket_idx_for_hash(h)
+					if self._is_hot(n):
+						mask[i] = _set._bucket_contains(n, obj, h)
+						continue
+				else:
+					n = None
+				cold.append((i, obj, h, n))
+
+		if cold:
+			cold.sort(key=lambda c: -1 if c[3] is None else c[3])
+			contained = await asyncio.get_running_loop().run_in_executor(
+				self.executor, self._cold_contains_many, cold)
+			for c, is_contained in zip(cold, contained):
+				mask[c[0]] = is_contained
+				if c[3] is not None:
+					self._hot.put(c[3], True)
+
+		if _set._stats is not None:
+			_set._stats.count_many(mask)
+		return list(itertools.compress(needles, mask)) if items else mask
+
+
+	def _is_hot( self, n ):
+		return self._hot.get(n) is not None or self.set._cache.get(n) is not None
+
+
+	def _cold_contains( self, obj, h, n=None ):
+		"""Probes an object with a known hash like 'hashset.__contains__' does after consulting the delta overlay."""
+		_set = self.set
+		if _set._bloom is not None and h not in _set._bloom:
+			if _set._stats is not None:
+				_set._stats.bloom_rejects += 1
+			return False
+		if n is None:
+			n = _set._bucket_idx_for_hash(h)
+		return _set._bucket_contains(n, obj, h)
+
+
+	def _cold_contains_many( self, cold ):
+		return [ self._cold_contains(obj, h, n) for _, obj, h, n in cold ]
+
+
+	def release( self ):
+		"""Releases the wrapped hash set if this instance opened it."""
+		if self._owned:
+			self.set.release()
+
+
+	async def __aenter__( self ):
+		return self
+
+	async def __aexit__( self, exc_type, exc, traceback ):
+		self.release()
+		return False
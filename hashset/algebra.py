@@ -0,0 +1,157 @@
+"""Set algebra between hash sets that share their layout, one bucket at a time.
+
+Two hash sets with the same hasher, pickler and bucket count assign equal
+items to buckets with the same index, so they can be combined bucket by
+bucket in a single sequential pass over each of them.
+"""
+
+import itertools, array
+from .header import header as hashset_header
+from .bloom import bloom_filter
+from .picklers import bytes_pickler, fixed_width_pickler, pickle_proxy
+from . import writer
+
+
+_hash_mask = (1 << 64) - 1
+
+
+def _layout( s ):
+	"""Returns what decides the bucket of an item in a hash set…
+
+	i. e. its bucket count, its hasher and the encoding of items that the
+	hasher digests. That's the pickler type and codec and, where items are
+	hashed along with a length prefix, the integer size and byte order of the
+	prefix. The bucket layout (e. g. 'sorted_buckets') doesn't matter.
+	"""
+
+	from . import registry
+	h = s.header
+
+	hasher = registry.describe_hasher(h.hasher)
+	if hasher is None:
+		hasher = (type(h.hasher), getattr(h.hasher, 'name', None))
+
+	p = h.pickler
+	pickler = registry.describe_pickler(p)
+	if pickler is None:
+		pickler = (type(p), getattr(getattr(p, 'codec', None), 'name', None),
+			getattr(p, 'dump_single', None) if isinstance(p, pickle_proxy) else None,
+			getattr(p, 'int_size', None), getattr(p, 'byteorder', None))
+	else:
+		pid, flags, int_size, width, param = pickler
+		pickler = (pid, param, width)
+		if isinstance(p, bytes_pickler) and not isinstance(p, fixed_width_pickler):
+			pickler += (int_size, flags & registry.BIG_ENDIAN)
+
+	return h.bucket_count, hasher, pickler
+
+
+def check_compatible( sets ):
+	"""Raises a ValueError unless all hash sets share the same hasher, pickler and bucket count…
+
+	as far as they decide the buckets of items (see '_layout') and none of
+	them uses a minimal perfect hash layout.
+	"""
+
+	if any(s._mph is not None for s in sets):
+		raise ValueError(
+			'Hash sets with a minimal perfect hash layout cannot be combined bucket '
+			'by bucket')
+
+	sets = iter(sets)
+	expected = _layout(next(sets))
+	for s in sets:
+		if _layout(s) != expected:
+			raise ValueError(
+				'Hash sets with different hashers, picklers or bucket counts cannot '
+				'be combined bucket by bucket')
+
+
+def iter_bucket_tuples( sets ):
+	"""Returns an iterator over the tuples of corresponding buckets of compatible hash sets."""
+	sets = tuple(sets)
+	check_compatible(sets)
+	return zip(*(s._iter_buckets() for s in sets))
+
+
+def union( buckets ):
+	return list(dict.fromkeys(itertools.chain.from_iterable(filter(None, buckets))))
+
+
+def intersection( buckets ):
+	first, *others = buckets
+	if not first:
+		return []
+	others = [ set(o or ()) for o in others ]
+	return [ item for item in first if all(item in o for o in others) ]
+
+
+def difference( buckets ):
+	first, *others = buckets
+	if not first:
+		return []
+	others = set(itertools.chain.from_iterable(filter(None, others)))
+	return [ item for item in first if item not in others ]
+
+
+def isdisjoint( sets ):
+	for a, b in iter_bucket_tuples(sets):
+		if a and b and not set(a).isdisjoint(b):
+			return False
+	return True
+
+
+def issubset( sets ):
+	for a, b in iter_bucket_tuples(sets):
+		if a and not set(a).issubset(b or ()):
+			return False
+	return True
+
+
+def write( file, sets, combine, bloom_bits_per_key=0 ):
+	"""Writes the combination of some compatible hash sets to a file.
+
+	'combine' maps a tuple of corresponding buckets to the list of items of the
+	resulting bucket (see 'union', 'intersection' and 'difference'). The
+	resulting buckets are encoded and spooled to a temporary file on the fly
+	since their sizes and count are required for the header and bucket index.
+	Returns the number of items written.
+	"""
+
+	import tempfile
+
+	first = sets[0].header
+	header = hashset_header(first.hasher, first.pickler)
+	header.bucket_count = first.bucket_count
+	header.compression = first.compression
+	header.fingerprint_size = first.fingerprint_size
+	shift = max(header.bucket_count.bit_length() - 1, 0)
+	with_hashes = bool(header.fingerprint_size or bloom_bits_per_key)
+
+	sizes = array.array('Q')
+	hashes = array.array('Q') if bloom_bits_per_key else None
+	count = 0
+	with tempfile.TemporaryFile(prefix='hashset-') as spool:
+		for bucket in map(combine, iter_bucket_tuples(sets)):
+			if bucket:
+				entries = writer.make_entries(header, bucket, with_hashes)
+				encoded = writer.encode_entries(header, shift, entries)
+				spool.write(encoded)
+				sizes.append(len(encoded))
+				count += len(bucket)
+				if hashes is not None:
+					hashes.extend(e[1] & _hash_mask for e in entries)
+			else:
+				sizes.append(0)
+
+		header.element_count = count
+		header.bloom_bits_per_key = bloom_bits_per_key
+		bloom = None
+		if hashes is not None:
+			bloom = bloom_filter.build(hashes, count, bloom_bits_per_key)
+
+		spool.seek(0)
+		writer.write(file, header, sizes, map(spool.read, filter(None, sizes)),
+			sum(sizes), bloom)
+
+	return count
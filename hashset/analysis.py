@@ -0,0 +1,222 @@
+"""Analyses of the layout of hash set files that only read their header and bucket index.
+
+The encoded length of every bucket follows from the differences between
+consecutive offsets in the bucket index, so the distribution of the buckets
+and the space taken by each section can be reported without touching the
+value section. Indexes of more than 'max_buckets' buckets are sampled in
+evenly spaced runs of consecutive buckets to keep the analysis of large files
+to a few seconds. Estimates for other build parameters assume that the hasher
+distributes the items uniformly.
+"""
+
+import math, operator, collections
+from .picklers import bytes_pickler, fixed_width_pickler, front_coded_pickler
+from .util.math import ceil_div, ceil_pow2
+
+
+percentiles = (0.5, 0.9, 0.99, 0.999)
+
+load_factors = (0.5, 2/3, 0.75, 1, 2)
+
+max_buckets = 1 << 24
+
+_sample_run = 1 << 12
+
+
+def bucket_lengths( _set, max_buckets=max_buckets ):
+	"""Returns a counter of the encoded bucket lengths (in bytes) of a buffer-backed hash set and the number of buckets counted…
+
+	which is less than the bucket count if there are more than 'max_buckets'
+	(unless None) and only a sample of them is counted.
+	"""
+
+	idx = _set.buckets_idx
+	count = len(idx)
+	if max_buckets is None or count <= max_buckets:
+		runs = ((0, count),)
+	else:
+		run = max(min(_sample_run, max_buckets // 64), 1)
+		run_count = max(max_buckets // run, 1)
+		stride = count // run_count
+		runs = ((start, start + run) for start in range(0, stride * run_count, stride))
+
+	lengths = collections.Counter()
+	counted = 0
+	for start, stop in runs:
+		ends = idx[start + 1 : stop + 1]
+		lengths.update(map(operator.sub, ends, idx[start : start + len(ends)]))
+		counted += len(ends)
+		if stop >= count and count:
+			lengths[_set._value_size - idx[-1]] += 1
+			counted += 1
+	return lengths, counted
+
+
+def _entry_count( header, length ):
+	"""Returns the number of entries in a bucket of a given encoded length or None if that's unknown without decoding it."""
+
+	if not length:
+		return 0
+	if header.mph_buckets:
+		return 1
+	pickler = header.pickler
+	if not isinstance(pickler, fixed_width_pickler):
+		return None
+
+	size = header.fingerprint_size
+	if not size:
+		return length // pickler.width
+	# Try every length of the variable-length entry count in front.
+	for prefix in range(1, 10):
+		count, rest = divmod(length - prefix, size + pickler.width)
+		if not rest and count.bit_length() <= 7 * prefix:
+			return count
+	return None
+
+
+def _percentile( sorted_counts, total, p ):
+	"""Returns the percentile of the values of a sorted sequence of values and their counts."""
+	rank = p * total
+	seen = 0
+	for value, count in sorted_counts:
+		seen += count
+		if seen >= rank:
+			return value
+	return None
+
+
+def index_int_size_for( value_size ):
+	"""Returns the smallest bucket index integer size that can address a value section of a given size."""
+	return ceil_pow2(max(ceil_div(value_size.bit_length(), 8), 1))
+
+
+def _item_length_prefixes( pickler ):
+	"""Returns how many item integers each entry of a pickler carries, i. e. length prefixes, or 0 for none."""
+	if isinstance(pickler, fixed_width_pickler) or not isinstance(pickler, bytes_pickler):
+		return 0
+	if isinstance(pickler, front_coded_pickler):
+		return 2
+	return 0 if pickler.sorted_buckets else 1
+
+
+def analyze( _set, max_buckets=max_buckets ):
+	"""Returns a mapping that describes the bucket distribution and the section sizes of a buffer-backed hash set.
+
+	The bucket counts of a sample (see 'bucket_lengths') are scaled to the
+	whole index; its maximum and percentiles are those of the sample.
+	"""
+
+	header = _set.header
+	lengths, counted = bucket_lengths(_set, max_buckets)
+	bucket_count = header.bucket_count
+	scale = bucket_count / counted if counted else 1
+	empty = round(lengths.get(0, 0) * scale)
+	chains = sorted((length, count) for length, count in lengths.items() if length)
+	non_empty = bucket_count - empty
+
+	histogram = collections.Counter()
+	for length, count in chains:
+		histogram[length.bit_length()] += count
+	histogram = { k: round(v * scale) for k, v in sorted(histogram.items()) }
+
+	entries = None
+	if all(_entry_count(header, length) is not None for length, _ in chains):
+		entries = collections.Counter()
+		for length, count in lengths.items():
+			entries[_entry_count(header, length)] += count
+		entries = { k: round(v * scale) for k, v in sorted(entries.items()) }
+
+	value_offset = header.value_offset()
+	index_size = bucket_count * header.int_size
+	bloom_size = header.bloom_size() if header.bloom_bits_per_key else 0
+	mph_size = header.mph_size() if header.mph_buckets else 0
+
+	return {
+		'element_count': header.element_count,
+		'bucket_count': bucket_count,
+		'sampled_buckets': counted if counted < bucket_count else None,
+		'load_factor':
+			header.element_count / bucket_count if bucket_count else None,
+		'empty_buckets': empty,
+		'empty_ratio': empty / bucket_count if bucket_count else None,
+		'max_chain_bytes': chains[-1][0] if chains else 0,
+		'mean_chain_bytes': _set._value_size / non_empty if non_empty else 0,
+		'chain_bytes_percentiles': {
+			p: _percentile(chains, counted - lengths.get(0, 0), p)
+			for p in percentiles },
+		# By the bit length of the chain length, i. e. bins from 2**(k-1) to 2**k - 1.
+		'chain_bytes_histogram': histogram,
+		'entry_histogram': entries,
+		'sections': {
+			'header': header.index_offset - bloom_size - mph_size,
+			'bloom': bloom_size,
+			'mph': mph_size,
+			'index': index_size,
+			'values': len(_set.buf) - value_offset,
+		},
+		'value_size': _set._value_size,
+		'file_size': len(_set.buf),
+	}
+
+
+def estimate( _set, analysis, load_factor=None, index_int_size=0,
+	item_int_size=0
+):
+	"""Estimates the bucket distribution and file size of a hash set with the same items built with other parameters…
+
+	i. e. another load factor, bucket index integer size and item integer
+	size, each where 0 means the smallest suitable one. If 'load_factor' is
+	None the bucket count stays the same; it has no effect on hash sets with a
+	minimal perfect hash layout either. The value section is assumed to be
+	uncompressed. Returns a mapping like that of 'analyze' with only the
+	estimated entries.
+	"""
+
+	header = _set.header
+	n = header.element_count
+	bucket_count = header.bucket_count
+	if load_factor is not None and not header.mph_buckets:
+		bucket_count = ceil_pow2(math.ceil(n / load_factor)) if n else 0
+
+	value_size = analysis['value_size']
+	prefixes = _item_length_prefixes(header.pickler)
+	if prefixes:
+		if not item_int_size:
+			# No item can be longer than the longest bucket, and the current size
+			# fits every item. A sample may miss the longest bucket.
+			item_int_size = header.pickler.int_size
+			if analysis['sampled_buckets'] is None:
+				item_int_size = min(item_int_size, max(
+					bytes_pickler.get_int_size_for_val(analysis['max_chain_bytes']), 1))
+		value_size += n * prefixes * (item_int_size - header.pickler.int_size)
+	else:
+		item_int_size = None
+
+	if not index_int_size:
+		index_int_size = index_int_size_for(value_size)
+	index_size = bucket_count * index_int_size
+
+	mean = n / bucket_count if bucket_count else 0
+	if header.mph_buckets:
+		# Every slot holds exactly one item.
+		empty_ratio = 1 - mean if bucket_count else None
+	else:
+		empty_ratio = math.exp(-mean) if bucket_count else None
+	sections = analysis['sections']
+	file_size = (
+		analysis['file_size'] - sections['index'] + index_size +
+		value_size - analysis['value_size'])
+
+	return {
+		'load_factor': mean if bucket_count else None,
+		'bucket_count': bucket_count,
+		'index_int_size': index_int_size,
+		'item_int_size': item_int_size,
+		'empty_ratio': empty_ratio,
+		'mean_chain_entries':
+			mean / (1 - empty_ratio) if empty_ratio is not None and empty_ratio < 1
+			else 0,
+		'index_size': index_size,
+		'value_size': value_size,
+		'file_size': file_size,
+	}
@@ -0,0 +1,88 @@
+"""Blocked Bloom filters over the item hashes of a hash set."""
+
+import math
+from .util.math import ceil_div, mix64
+
+
+class bloom_filter:
+	"""A blocked Bloom filter…
+
+	whose blocks are the size of a typical cache line. Each hash selects one
+	block and sets or tests a number of bits inside it, so a lookup reads a
+	single block.
+
+	Only the lower 64 bits of a hash are used. Since the lowest bits also select
+	the bucket of an item they're mixed before use.
+	"""
+
+	block_size = 64
+	_block_bits = block_size * 8
+
+
+	def __init__( self, buf, bits_per_key ):
+		"""Initializes a Bloom filter backed by a buffer…
+
+		whose length is a multiple of the block size. The buffer must be writable
+		to add hashes.
+		"""
+
+		if len(buf) % self.block_size:
+			raise ValueError(
+				'Buffer length {:d} is not a multiple of {:d}'
+					.format(len(buf), self.block_size))
+
+		self.buf = buf
+		self.block_count = len(buf) // self.block_size
+		self.probes = self.probe_count(bits_per_key)
+
+
+	@classmethod
+	def size_for( cls, count, bits_per_key ):
+		"""Returns the size (in bytes) of a filter for a number of items and bits per item."""
+		if bits_per_key <= 0:
+			return 0
+		return max(ceil_div(count * bits_per_key, cls._block_bits), 1) * cls.block_size
+
+
+	@staticmethod
+	def probe_count( bits_per_key ):
+		"""Returns the number of bits per item that minimizes the false positive rate."""
+		return min(max(round(bits_per_key * math.log(2)), 1), 16)
+
+
+	@classmethod
+	def build( cls, hashes, count, bits_per_key ):
+		"""Builds a new in-memory Bloom filter for 'count' hashes."""
+		f = cls(bytearray(cls.size_for(count, bits_per_key)), bits_per_key)
+		for h in hashes:
+			f.add(h)
+		return f
+
+
+	def _locate( self, h ):
+		"""Returns the offset of the block and the bit mask inside it for a hash."""
+
+		h = mix64(h)
+		offset = (h >> 32) % self.block_count * self.block_size
+		pos = h & (self._block_bits - 1)
+		step = (h >> 9) & (self._block_bits - 1) | 1
+		mask = 0
+		for _ in range(self.probes):
+			mask |= 1 << pos
+			pos = (pos + step) & (self._block_bits - 1)
+		return offset, mask
+
+
+	def __contains__( self, h ):
+		"""Tests if a hash may have been added to this filter."""
+		offset, mask = self._locate(h)
+		block = int.from_bytes(self.buf[offset : offset + self.block_size], 'little')
+		return block & mask == mask
+
+
+	def add( self, h ):
+		"""Adds a hash to this filter."""
+		offset, mask = self._locate(h)
+		end = offset + self.block_size
+		block = int.from_bytes(self.buf[offset:end], 'little') | mask
+		self.buf[offset:end] = block.to_bytes(self.block_size, 'little')
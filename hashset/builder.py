@@ -0,0 +1,348 @@
+"""Builds hash set files from more items than fit into memory."""
+
+import os, math, struct, heapq, itertools, functools, collections, array
+import tempfile, contextlib
+import hashset.util.iter as util_iter
+from .header import header as hashset_header
+from .picklers import codec_pickler, fixed_width_pickler
+from .bloom import bloom_filter
+from .compression import get_codec
+from . import writer, fingerprint
+from .util.math import is_pow2, ceil_pow2
+
+
+_spill_record = struct.Struct('=QI')
+_bucket_record = struct.Struct('=QQ')
+_hash_mask = (1 << 64) - 1
+
+
+def _encode_items( header, bypass, partitions, items ):
+	"""Encodes and hashes items and returns their spill records per partition.
+
+	'bypass' restores the bypass mode of a codec pickler which isn't preserved
+	when a header is sent to another process.
+	"""
+
+	pickler = header.pickler
+	if bypass:
+		pickler.set_bypass_for(pickler.codec)
+
+	pack = _spill_record.pack
+	buffers = [[] for _ in range(partitions)]
+	for obj in items:
+		converted = bytes(pickler.dump_single_convert(obj))
+		h = header.hash_converted(obj, converted) & _hash_mask
+		buffers[h & (partitions - 1)] += (pack(h, len(converted)), converted)
+	return list(map(b''.join, buffers))
+
+
+def _load_partitions( paths ):
+	"""Returns the distinct items of some spill files as a mapping from their encoded form to their hash."""
+
+	items = {}
+	record = _spill_record
+	for path in filter(os.path.exists, paths):
+		with open(path, 'rb') as f:
+			buf = f.read()
+		offset = 0
+		while offset < len(buf):
+			h, length = record.unpack_from(buf, offset)
+			offset += record.size
+			items.setdefault(buf[offset : offset + length], h)
+			offset += length
+	return items
+
+
+def _count_partition( path ):
+	"""Returns the number of distinct items in a spill file and the length of the longest one."""
+	items = _load_partitions((path,))
+	return len(items), max(map(len, items), default=0)
+
+
+def _make_run( header, spill_paths, run_path, hash_mask, with_hashes ):
+	"""Encodes the buckets of some spill files into a run…
+
+	i. e. the files '<run_path>.records' with the index and size of each
+	non-empty bucket and '<run_path>.data' with the encoded buckets, both in
+	bucket order. If 'with_hashes' is true, the item hashes are written to
+	'<run_path>.hashes'. Returns the total size of the encoded buckets.
+	"""
+
+	fingerprint_size = header.fingerprint_size
+	shift = hash_mask.bit_length()
+	buckets = collections.defaultdict(list)
+	hashes = array.array('Q')
+	for converted, h in _load_partitions(spill_paths).items():
+		buckets[h & hash_mask].append(
+			(converted, h) if fingerprint_size else converted)
+		if with_hashes:
+			hashes.append(h)
+
+	size = 0
+	pack = _bucket_record.pack
+	with open(run_path + '.records', 'wb') as records, \
+		open(run_path + '.data', 'wb') as data \
+	:
+		for n in sorted(buckets):
+			bucket = buckets.pop(n)
+			if fingerprint_size:
+				bucket.sort()
+				bucket = fingerprint.join(
+					[ fingerprint.of(h, fingerprint_size, shift) for _, h in bucket ],
+					fingerprint_size,
+					header.pickler.join_bucket([ c for c, _ in bucket ]))
+			else:
+				bucket = header.pickler.join_bucket(bucket)
+			records.write(pack(n, len(bucket)))
+			data.write(bucket)
+			size += len(bucket)
+
+	if with_hashes:
+		with open(run_path + '.hashes', 'wb') as f:
+			hashes.tofile(f)
+	return size
+
+
+def _iter_run_records( f ):
+	"""Returns an iterator over the bucket records of a run from its beginning."""
+	f.seek(0)
+	return itertools.chain.from_iterable(map(
+		_bucket_record.iter_unpack,
+		iter(functools.partial(f.read, _bucket_record.size << 12), b'')))
+
+
+class builder:
+	"""Builds a hash set file from a stream of items under a memory budget.
+
+	Items are encoded and hashed as they arrive and buffered per partition,
+	where the partition is selected by the lowest bits of their hash. Whenever
+	the buffers exceed the memory limit they're spilled to temporary files.
+	'to_file' then deduplicates and encodes one partition at a time and merges
+	the encoded buckets of all partitions into the final file.
+
+	Since every partition must fit into memory on its own, the largest
+	supported input is roughly 'partitions' times 'memory_limit'.
+
+	With more than one job, the items passed to 'update' are encoded and
+	hashed in chunks by worker processes, and the partitions are counted and
+	encoded in parallel. The memory limit then applies to each process.
+
+	The pickler must encode buckets as a sequence of records (see
+	'bytes_pickler.join_bucket'). Since items are hashed as they arrive, the
+	size of the item lengths of a length-prefixed pickler must be set up front;
+	the width of a fixed-width pickler is derived from the items if it's unset.
+	"""
+
+	_item_overhead = 64
+	chunk_size = 1 << 14
+	default_item_int_size = 4
+
+
+	def __init__( self, _from=None, load_factor=2/3, memory_limit=64<<20,
+		partitions=256, tmpdir=None, bloom_bits_per_key=0, jobs=1,
+		compression=None, block_size=1<<16, fingerprint_size=0
+	):
+		"""Initializes a new builder.
+
+		'_from' is an optional mapping like the one accepted by the 'hashset'
+		constructor; the default pickler is 'codec_pickler.string_instance' with
+		item lengths of 'default_item_int_size' bytes.
+		'memory_limit' is the approximate amount of memory (in bytes) used to
+		buffer items before they're spilled to temporary files in 'tmpdir'.
+		'jobs' is the number of worker processes or, if 0, the number of CPUs.
+		'compression', 'block_size' and 'fingerprint_size' are like the arguments
+		to 'hashset.to_file'.
+		"""
+
+		from .hashers import default_hasher
+		kwargs = dict(hasher=default_hasher, pickler=None)
+		if _from is not None: kwargs.update(_from)
+		pickler = kwargs.pop('pickler')
+		if pickler is None:
+			pickler = codec_pickler.string_instance(
+				int_size=self.default_item_int_size)
+		if not hasattr(pickler, 'join_bucket'):
+			raise TypeError(
+				'The pickler {!r} doesn\'t encode buckets as records'.format(pickler))
+		if not isinstance(pickler, fixed_width_pickler) and pickler.int_size <= 0:
+			raise ValueError(
+				'The item int size of the pickler {!r} must be set before items are '
+				'added'.format(pickler))
+		if not (partitions > 0 and is_pow2(partitions)):
+			raise ValueError(
+				'partitions must be a positive power of 2, not {:d}'.format(partitions))
+		if jobs < 0:
+			raise ValueError('Negative job count: {:d}'.format(jobs))
+
+		self.header = hashset_header(kwargs.pop('hasher'), pickler, **kwargs)
+		self.header.bloom_bits_per_key = bloom_bits_per_key
+		if compression:
+			get_codec(compression)
+			self.header.compression = compression
+		if fingerprint_size:
+			if fingerprint_size not in fingerprint.sizes:
+				raise ValueError(
+					'Unsupported fingerprint size: {:d}'.format(fingerprint_size))
+			self.header.fingerprint_size = fingerprint_size
+		self.block_size = block_size
+		self.load_factor = load_factor
+		self.memory_limit = memory_limit
+		self.jobs = jobs or os.cpu_count() or 1
+
+		self._tmpdir = tempfile.TemporaryDirectory(prefix='hashset-', dir=tmpdir)
+		self._buffers = [[] for _ in range(partitions)]
+		self._buffered_size = 0
+		self._spills = [None] * partitions
+		self._executor = None
+
+
+	def add( self, obj ):
+		"""Adds an item; duplicates are removed later."""
+		converted = bytes(self.header.pickler.dump_single_convert(obj))
+		h = self.header.hash_converted(obj, converted) & _hash_mask
+		self._buffers[h & (len(self._buffers) - 1)] += (
+			_spill_record.pack(h, len(converted)), converted)
+		self._buffered_size += self._item_overhead + len(converted)
+		if self._buffered_size > self.memory_limit:
+			self._spill()
+
+
+	def update( self, *iterables ):
+		items = itertools.chain.from_iterable(iterables)
+		if self.jobs <= 1:
+			util_iter.each(self.add, items)
+			return
+
+		get_bypass = getattr(self.header.pickler, 'get_bypass_for', None)
+		encode = functools.partial(_encode_items, self.header,
+			bool(get_bypass and get_bypass()), len(self._buffers))
+		executor = self._get_executor()
+		pending = collections.deque()
+		for chunk in util_iter.chunked(items, self.chunk_size):
+			if len(pending) >= 2 * self.jobs:
+				self._write_spills(pending.popleft().result())
+			pending.append(executor.submit(encode, chunk))
+		while pending:
+			self._write_spills(pending.popleft().result())
+
+
+	def _get_executor( self ):
+		if self._executor is None:
+			import concurrent.futures
+			self._executor = concurrent.futures.ProcessPoolExecutor(self.jobs)
+		return self._executor
+
+
+	def _map( self, func, *iterables ):
+		"""Like 'map' but runs in the worker processes if there are any."""
+		if self.jobs <= 1:
+			return map(func, *iterables)
+		return self._get_executor().map(func, *iterables)
+
+
+	def _path( self, name, i ):
+		return os.path.join(self._tmpdir.name, '{:s}-{:d}'.format(name, i))
+
+
+	def _write_spills( self, records ):
+		for i, data in enumerate(records):
+			if data:
+				f = self._spills[i]
+				if f is None:
+					f = open(self._path('spill', i), 'wb')
+					self._spills[i] = f
+				f.write(data)
+
+
+	def _spill( self ):
+		self._write_spills(map(b''.join, self._buffers))
+		util_iter.each(list.clear, self._buffers)
+		self._buffered_size = 0
+
+
+	def _merged_sizes( self, records, bucket_count ):
+		n = 0
+		for i, size in heapq.merge(*map(_iter_run_records, records)):
+			yield from itertools.repeat(0, i - n)
+			yield size
+			n = i + 1
+		yield from itertools.repeat(0, bucket_count - n)
+
+
+	def _merged_buckets( self, records, data ):
+		for (_, size), f in heapq.merge(*map(
+			lambda r, d: zip(_iter_run_records(r), itertools.repeat(d)),
+			records, data
+		)):
+			yield f.read(size)
+
+
+	def to_file( self, file ):
+		"""Writes the hash set built from all added items to a file."""
+
+		self._spill()
+		util_iter.each(lambda f: f.flush(), filter(None, self._spills))
+		spill_paths = [ self._path('spill', i) for i in range(len(self._spills)) ]
+		header = self.header
+		pickler = header.pickler
+
+		counts = list(self._map(_count_partition, spill_paths))
+		count = sum(map(lambda c: c[0], counts))
+		max_length = max(map(lambda c: c[1], counts), default=0)
+
+		if isinstance(pickler, fixed_width_pickler):
+			pickler.fit_length(max_length)
+		header.reevaluate()
+
+		bucket_count = ceil_pow2(math.ceil(count / self.load_factor)) if count else 0
+		header.element_count = count
+		header.bucket_count = bucket_count
+
+		# If there are fewer buckets than partitions, the items of one bucket are
+		# spread over several partitions which must go into the same run.
+		stride = min(bucket_count, len(spill_paths))
+		run_paths = [ self._path('run', i) for i in range(stride) ]
+		value_size = sum(self._map(
+			functools.partial(_make_run, header),
+			(spill_paths[i::stride] for i in range(stride)), run_paths,
+			itertools.repeat(bucket_count - 1),
+			itertools.repeat(bool(header.bloom_bits_per_key))))
+
+		bloom = None
+		if header.bloom_bits_per_key:
+			bloom = bloom_filter(
+				bytearray(header.bloom_size()), header.bloom_bits_per_key)
+			hashes = array.array('Q')
+			for path in run_paths:
+				with open(path + '.hashes', 'rb') as f:
+					hashes.frombytes(f.read())
+				util_iter.each(bloom.add, hashes)
+				del hashes[:]
+
+		with contextlib.ExitStack() as es:
+			records, data = (
+				[ es.enter_context(open(path + ext, 'rb')) for path in run_paths ]
+				for ext in ('.records', '.data'))
+			writer.write(file, header, self._merged_sizes(records, bucket_count),
+				self._merged_buckets(records, data), value_size, bloom,
+				block_size=self.block_size)
+
+
+	def close( self ):
+		"""Stops the worker processes and removes all temporary files."""
+		if self._executor is not None:
+			self._executor.shutdown()
+			self._executor = None
+		util_iter.each(lambda f: f.close(), filter(None, self._spills))
+		self._spills = [None] * len(self._spills)
+		util_iter.each(list.clear, self._buffers)
+		self._buffered_size = 0
+		self._tmpdir.cleanup()
+
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, exc_type, exc, traceback ):
+		self.close()
+		return False
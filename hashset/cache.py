@@ -0,0 +1,174 @@
+"""Caches for the decoded buckets of buffer-backed hash sets."""
+
+import operator, collections
+
+
+class null_cache:
+	"""A cache that never retains anything."""
+
+	def __len__( self ):
+		return 0
+
+
+	def get( self, key, default=None ):
+		return default
+
+
+	def put( self, key, value, size=0 ):
+		"""Offers a value of a given (encoded) size to this cache and returns it."""
+		return value
+
+
+	def values( self ):
+		return ()
+
+
+	def clear( self ):
+		pass
+
+
+class unbounded_cache(dict):
+	"""A cache that retains every value it's offered.
+
+	Unlike a dense list of buckets it only allocates space for the buckets that
+	were actually decoded.
+	"""
+
+	def put( self, key, value, size=0 ):
+		"""Offers a value of a given (encoded) size to this cache and returns it."""
+		self[key] = value
+		return value
+
+
+class lru_cache:
+	"""A cache that evicts the least recently used values…
+
+	as soon as it holds more than 'max_entries' values or the total size of its
+	values exceeds 'max_size'. Either limit may be None to disable it.
+	"""
+
+	def __init__( self, max_entries=1<<16, max_size=None ):
+		if max_entries is not None and max_entries < 0:
+			raise ValueError('Negative max_entries: {:d}'.format(max_entries))
+		if max_size is not None and max_size < 0:
+			raise ValueError('Negative max_size: {:d}'.format(max_size))
+
+		self.max_entries = max_entries
+		self.max_size = max_size
+		self.size = 0
+		self._data = collections.OrderedDict()
+
+
+	def __len__( self ):
+		return len(self._data)
+
+
+	def get( self, key, default=None ):
+		entry = self._data.get(key)
+		if entry is None:
+			return default
+		self._data.move_to_end(key)
+		return entry[0]
+
+
+	def put( self, key, value, size=0 ):
+		"""Offers a value of a given (encoded) size to this cache and returns it."""
+		old = self._data.pop(key, None)
+		if old is not None:
+			self.size -= old[1]
+		self._data[key] = (value, size)
+		self.size += size
+		self._evict()
+		return value
+
+
+	def _evict( self ):
+		data = self._data
+		while data and (
+			(self.max_entries is not None and len(data) > self.max_entries) or
+			(self.max_size is not None and self.size > self.max_size)
+		):
+			self.size -= data.popitem(last=False)[1][1]
+
+
+	def values( self ):
+		return map(operator.itemgetter(0), self._data.values())
+
+
+	def clear( self ):
+		self._data.clear()
+		self.size = 0
+
+
+class locked_cache:
+	"""Wraps another cache so that it can be shared between threads.
+
+	Every operation on the wrapped cache holds a lock.
+	"""
+
+	def __init__( self, cache ):
+		import threading
+		self.cache = cache
+		self.lock = threading.Lock()
+
+
+	def __len__( self ):
+		with self.lock:
+			return len(self.cache)
+
+
+	def get( self, key, default=None ):
+		with self.lock:
+			return self.cache.get(key, default)
+
+
+	def put( self, key, value, size=0 ):
+		"""Offers a value of a given (encoded) size to this cache and returns it."""
+		with self.lock:
+			return self.cache.put(key, value, size)
+
+
+	def values( self ):
+		with self.lock:
+			return tuple(self.cache.values())
+
+
+	def clear( self ):
+		with self.lock:
+			self.cache.clear()
+
+
+policies = {
+	'none': null_cache,
+	'lru': lru_cache,
+	'unbounded': unbounded_cache,
+}
+
+
+def make_cache( policy=None, thread_safe=False, **kwargs ):
+	"""Returns a bucket cache.
+
+	'policy' is either the name of a cache policy, i. e. one of the keys of
+	'policies', or an existing cache instance which is returned as is. Other
+	arguments are forwarded to the cache constructor. The default policy is
+	'unbounded'.
+
+	If 'thread_safe' is true, the cache is wrapped in a 'locked_cache' unless
+	it's one already.
+	"""
+
+	if policy is None:
+		policy = 'unbounded'
+	if not isinstance(policy, str):
+		if thread_safe and not isinstance(policy, locked_cache):
+			return locked_cache(policy)
+		return policy
+
+	try:
+		cache_type = policies[policy]
+	except KeyError:
+		raise ValueError(
+			'Unknown cache policy {!r}, expected one of: {}'
+				.format(policy, ', '.join(policies)))
+	cache = cache_type(**kwargs)
+	return locked_cache(cache) if thread_safe else cache
@@ -0,0 +1,106 @@
+"""Block compression of the value section of hash set files.
+
+A compressed value section is a sequence of blocks, each of which holds
+consecutive encoded buckets that are compressed together, followed by a
+trailer: the uncompressed offsets at which the blocks start and their offsets
+in the compressed section, each with a sentinel for the end of the last
+block, and finally the number of blocks. The bucket index refers to offsets
+in the uncompressed value section.
+"""
+
+import bisect, struct, array, importlib
+from .cache import lru_cache, locked_cache
+
+
+codecs = ('zlib', 'bz2', 'lzma')
+
+_count = struct.Struct('=Q')
+
+
+def get_codec( name ):
+	"""Returns the standard library module that implements a compression codec."""
+	if name not in codecs:
+		raise ValueError(
+			'Unknown compression codec {!r}, expected one of: {}'
+				.format(name, ', '.join(codecs)))
+	return importlib.import_module(name)
+
+
+def write_blocks( file, buckets, codec, block_size=1<<16 ):
+	"""Compresses encoded buckets into blocks of about 'block_size' (uncompressed) bytes and writes them to a file along with the trailer."""
+
+	compress = get_codec(codec).compress
+	starts = array.array('Q', (0,))
+	offsets = array.array('Q', (0,))
+	block = []
+	length = 0
+
+	def flush():
+		data = compress(b''.join(block))
+		file.write(data)
+		starts.append(starts[-1] + length)
+		offsets.append(offsets[-1] + len(data))
+		block.clear()
+
+	for bucket in buckets:
+		block.append(bucket)
+		length += len(bucket)
+		if length >= block_size:
+			flush()
+			length = 0
+	if block:
+		flush()
+
+	# Align the trailer to its integer size.
+	file.write(bytes(-offsets[-1] % _count.size))
+	file.write(starts)
+	file.write(offsets)
+	file.write(_count.pack(len(starts) - 1))
+
+
+class block_reader:
+	"""Locates and decompresses the blocks of a compressed value section…
+
+	'buf' is a buffer that starts with the compressed blocks and ends with the
+	trailer. Recently decompressed blocks are retained in an LRU cache, which is
+	guarded by a lock if 'thread_safe' is true.
+	"""
+
+	cache_entries = 8
+
+
+	def __init__( self, buf, codec, thread_safe=False ):
+		self.decompress = get_codec(codec).decompress
+		count = _count.unpack_from(buf, len(buf) - _count.size)[0]
+		table = buf[
+			len(buf) - _count.size - 2 * (count + 1) * _count.size :
+			len(buf) - _count.size].cast('Q')
+		self.buf = buf
+		self._table = table
+		self.starts = table[: count + 1]
+		self.offsets = table[count + 1 :]
+		self.cache = lru_cache(self.cache_entries)
+		if thread_safe:
+			self.cache = locked_cache(self.cache)
+
+
+	@property
+	def value_size( self ):
+		"""The size of the uncompressed value section."""
+		return self.starts[-1]
+
+
+	def locate( self, offset ):
+		"""Returns the decompressed block that contains an uncompressed offset and the offset inside that block."""
+		i = bisect.bisect_right(self.starts, offset) - 1
+		block = self.cache.get(i)
+		if block is None:
+			block = self.cache.put(i, self.decompress(
+				self.buf[self.offsets[i] : self.offsets[i + 1]]))
+		return block, offset - self.starts[i]
+
+
+	def release( self ):
+		self.cache.clear()
+		for view in (self.starts, self.offsets, self._table, self.buf):
+			view.release()
@@ -0,0 +1,302 @@
+"""A daemon that answers membership queries for hash sets over a UNIX domain socket.
+
+A client sends a sequence of requests, each of which holds an item, and
+receives one response per request in the same order. A response holds one
+character per served hash set, '1' if it contains the item and '0' otherwise.
+Requests may be pipelined. Two framings are supported:
+
+ * 'line': Every request and response is a line terminated by a line feed.
+   This suits shell scripts, e. g. with 'socat'.
+
+ * 'length': Every request and response is prefixed with its length as a
+   4-byte little-endian integer, so that items may contain line feeds.
+
+Requests that arrive concurrently, on one or many connections, are coalesced
+into batches that are probed with 'hashset.contains_many' in a worker thread.
+
+'asyncio' and 'socket' are imported on demand to keep the start-up of the
+command-line interface short.
+"""
+
+import os, stat, errno, struct
+
+
+framings = ('line', 'length')
+
+_length = struct.Struct('<I')
+_one = ord('1')
+
+
+def _remove_stale_socket( path ):
+	"""Removes the socket at a given path unless it's missing or isn't a socket…
+
+	or raises OSError if a server listens on it, since 'start_unix_server'
+	would replace any socket.
+	"""
+
+	try:
+		if not stat.S_ISSOCK(os.stat(path).st_mode):
+			return
+	except FileNotFoundError:
+		return
+
+	import socket
+	with socket.socket(socket.AF_UNIX) as sock:
+		try:
+			sock.connect(path)
+		except ConnectionRefusedError:
+			try:
+				os.unlink(path)
+			except FileNotFoundError:
+				pass
+		else:
+			raise OSError(errno.EADDRINUSE, os.strerror(errno.EADDRINUSE), path)
+
+
+class server:
+	"""Answers membership queries for some thread-safe hash sets (see 'hashset.hashset').
+
+	'decoders' is a sequence of callables, one per hash set, that map the bytes
+	of a request to the item to probe; by default the bytes are probed as is.
+	At most 'batch_size' requests are probed at once.
+	"""
+
+	def __init__( self, sets, decoders=None, batch_size=1024, framing='line' ):
+		if framing not in framings:
+			raise ValueError(
+				'Unknown framing {!r}, expected one of: {}'
+					.format(framing, ', '.join(framings)))
+		if batch_size <= 0:
+			raise ValueError('Non-positive batch size: {:d}'.format(batch_size))
+
+		self.sets = tuple(sets)
+		self.decoders = (
+			(None,) * len(self.sets) if decoders is None else tuple(decoders))
+		self.batch_size = batch_size
+		self.framing = framing
+		self._queue = None
+
+
+	def run( self, path ):
+		"""Serves requests on a socket at a given path until interrupted."""
+		import asyncio
+		try:
+			asyncio.run(self.serve(path))
+		except KeyboardInterrupt:
+			pass
+
+
+	async def serve( self, path ):
+		"""Serves requests on a socket at a given path until cancelled…
+
+		replacing a stale socket that no server listens on anymore. The socket
+		is removed afterwards.
+		"""
+
+		import asyncio
+		self._queue = asyncio.Queue()
+		batcher = asyncio.ensure_future(self._run_batches())
+		try:
+			_remove_stale_socket(path)
+			srv = await asyncio.start_unix_server(self._handle, path)
+			try:
+				async with srv:
+					await srv.serve_forever()
+			finally:
+				try:
+					os.unlink(path)
+				except FileNotFoundError:
+					pass
+		finally:
+			batcher.cancel()
+
+
+	async def _run_batches( self ):
+		import asyncio
+		loop = asyncio.get_running_loop()
+		queue = self._queue
+		while True:
+			batch = [ await queue.get() ]
+			while len(batch) < self.batch_size and not queue.empty():
+				batch.append(queue.get_nowait())
+
+			try:
+				responses = await loop.run_in_executor(
+					None, self._probe, [ request[0] for request in batch ])
+			except Exception as ex:
+				for _, future in batch:
+					if not future.done():
+						future.set_exception(ex)
+			else:
+				for (_, future), response in zip(batch, responses):
+					if not future.done():
+						future.set_result(response)
+
+
+	def _probe( self, payloads ):
+		"""Returns the responses to a batch of requests."""
+		rows = [ bytearray(b'0' * len(self.sets)) for _ in payloads ]
+		for k, (_set, decode) in enumerate(zip(self.sets, self.decoders)):
+			if decode is None:
+				indices = range(len(payloads))
+				needles = payloads
+			else:
+				indices = []
+				needles = []
+				for i, payload in enumerate(payloads):
+					try:
+						needles.append(decode(payload))
+					except ValueError:
+						# Items that can't be decoded aren't contained either.
+						continue
+					indices.append(i)
+
+			for i, contained in zip(indices, _set.contains_many(needles)):
+				if contained:
+					rows[i][k] = _one
+		return list(map(bytes, rows))
+
+
+	async def _handle( self, reader, writer ):
+		import asyncio
+		loop = asyncio.get_running_loop()
+		pending = asyncio.Queue()
+		responder = asyncio.ensure_future(self._respond(pending, writer))
+		try:
+			while not responder.done():
+				payload = await self._read(reader)
+				if payload is None:
+					break
+				future = loop.create_future()
+				self._queue.put_nowait((payload, future))
+				pending.put_nowait(future)
+		except (ValueError, ConnectionError):
+			# Oversized lines or broken connections end the session.
+			pass
+		finally:
+			pending.put_nowait(None)
+			try:
+				await responder
+			except Exception:
+				pass
+			writer.close()
+
+
+	async def _read( self, reader ):
+		"""Returns the payload of the next request or None at the end of the stream."""
+		import asyncio
+		if self.framing == 'line':
+			line = await reader.readline()
+			if not line:
+				return None
+			return line[:-1] if line.endswith(b'\n') else line
+
+		try:
+			length = _length.unpack(await reader.readexactly(_length.size))[0]
+			return await reader.readexactly(length)
+		except asyncio.IncompleteReadError:
+			return None
+
+
+	async def _respond( self, pending, writer ):
+		while True:
+			future = await pending.get()
+			if future is None:
+				break
+			response = await future
+			if self.framing == 'line':
+				writer.write(response + b'\n')
+			else:
+				writer.write(_length.pack(len(response)) + response)
+			if pending.empty():
+				await writer.drain()
+
+
+class client:
+	"""A blocking client for 'server'.
+
+	Items are given as byte sequences or as strings that are encoded with
+	'encoding'.
+	"""
+
+	def __init__( self, path, framing='line', encoding='utf-8' ):
+		if framing not in framings:
+			raise ValueError(
+				'Unknown framing {!r}, expected one of: {}'
+					.format(framing, ', '.join(framings)))
+
+		import socket
+		self.framing = framing
+		self.encoding = encoding
+		self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			self._socket.connect(path)
+			self._file = self._socket.makefile('rwb')
+		except BaseException:
+			self._socket.close()
+			raise
+
+
+	def contains( self, item ):
+		"""Returns a tuple of booleans that tell which served hash sets contain an item."""
+		return next(self.contains_many((item,)))
+
+
+	def contains_many( self, items, window=1024 ):
+		"""Returns an iterator over the results of 'contains' for many items.
+
+		Up to 'window' requests are sent ahead of their responses.
+		"""
+
+		pending = 0
+		items = iter(items)
+		while True:
+			for item in items:
+				self._write(item)
+				pending += 1
+				if pending >= window:
+					break
+			if not pending:
+				return
+			self._file.flush()
+			while pending:
+				yield tuple(c == _one for c in self._read())
+				pending -= 1
+
+
+	def _write( self, item ):
+		if isinstance(item, str):
+			item = item.encode(self.encoding)
+		if self.framing == 'line':
+			if b'\n' in item:
+				raise ValueError('Items may not contain line feeds with line framing')
+			self._file.write(item + b'\n')
+		else:
+			self._file.write(_length.pack(len(item)))
+			self._file.write(item)
+
+
+	def _read( self ):
+		if self.framing == 'line':
+			response = self._file.readline()
+			if not response.endswith(b'\n'):
+				raise ConnectionError('The server closed the connection')
+			return response[:-1]
+
+		header = self._file.read(_length.size)
+		if len(header) < _length.size:
+			raise ConnectionError('The server closed the connection')
+		return self._file.read(_length.unpack(header)[0])
+
+
+	def close( self ):
+		self._file.close()
+		self._socket.close()
+
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, exc_type, exc, traceback ):
+		self.close()
+		return False
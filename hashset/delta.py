@@ -0,0 +1,53 @@
+"""Append-only logs of additions to and removals from a hash set file."""
+
+import struct
+
+
+_magic = b'hashdlt\n'
+_record = struct.Struct('<cI')
+
+ADD = b'+'
+REMOVE = b'-'
+
+
+def append( file, added=(), removed=() ):
+	"""Appends records for some encoded items to a delta log opened in binary append mode.
+
+	A new log is prefixed with a magic byte sequence first.
+	"""
+
+	if file.tell() == 0:
+		file.write(_magic)
+	for op, keys in ((ADD, added), (REMOVE, removed)):
+		for key in keys:
+			file.write(_record.pack(op, len(key)))
+			file.write(key)
+
+
+def read( file ):
+	"""Returns an iterator over the operations and encoded items of a delta log…
+
+	given as a path name or a file object opened in binary mode. An incomplete
+	trailing record, e. g. from an interrupted append, is ignored.
+	"""
+
+	if isinstance(file, (str, bytes, int)) or hasattr(file, '__fspath__'):
+		with open(file, 'rb') as f:
+			buf = f.read()
+	else:
+		buf = file.read()
+
+	if buf and buf[:len(_magic)] != _magic:
+		raise ValueError(
+			'Unknown magic {!r}, expected {!r}'.format(buf[:len(_magic)], _magic))
+
+	offset = len(_magic)
+	while offset + _record.size <= len(buf):
+		op, length = _record.unpack_from(buf, offset)
+		offset += _record.size
+		if offset + length > len(buf):
+			break
+		if op not in (ADD, REMOVE):
+			raise ValueError('Unknown delta operation {!r}'.format(op))
+		yield op, buf[offset : offset + length]
+		offset += length
@@ -0,0 +1,65 @@
+"""Short per-entry hash fingerprints stored in front of encoded buckets.
+
+A bucket with fingerprints starts with its entry count as a variable-length
+integer (7 bits per byte, least significant group first), followed by one
+fingerprint per entry in the order of the entries and the bucket as encoded
+by the pickler. Fingerprints are stored in native byte order like the bucket
+index. A fingerprint holds the hash bits right above those that select the
+bucket, so it also tells into which bucket of a larger hash set an entry
+would go.
+"""
+
+import array
+
+
+sizes = (1, 2)
+
+
+def _typecode( size ):
+	return 'BH'[size - 1]
+
+
+def shift_for( header ):
+	"""Returns the position of the lowest fingerprint bit in an item hash."""
+	if header.mph_buckets:
+		return 0
+	return max(header.bucket_count.bit_length() - 1, 0)
+
+
+def of( h, size, shift ):
+	"""Returns the fingerprint of a hash."""
+	return (h >> shift) & ((1 << (size * 8)) - 1)
+
+
+def join( fingerprints, size, data ):
+	"""Prefixes an encoded bucket with a sequence of fingerprints."""
+	fingerprints = array.array(_typecode(size), fingerprints)
+	count = len(fingerprints)
+	prefix = bytearray()
+	while True:
+		if count < 0x80:
+			prefix.append(count)
+			break
+		prefix.append(count & 0x7f | 0x80)
+		count >>= 7
+	return b''.join((prefix, fingerprints.tobytes(), data))
+
+
+def split( buf, offset, length, size ):
+	"""Returns the fingerprints of an encoded bucket as an array and the offset and length of the remaining bucket."""
+
+	end = offset + length
+	count = 0
+	shift = 0
+	while True:
+		b = buf[offset]
+		offset += 1
+		count |= (b & 0x7f) << shift
+		shift += 7
+		if b < 0x80:
+			break
+
+	fingerprints = array.array(_typecode(size),
+		bytes(buf[offset : offset + count * size]))
+	offset += count * size
+	return fingerprints, offset, end - offset
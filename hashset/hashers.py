@@ -40,17 +40,41 @@ class hashlib_proxy:
 		self.__init__(*state)
 
 
+class _pyhash_algorithms:
+	"""Lists the hash algorithms of 'pyhash', if available, on first access…
+
+	which imports the module. The result replaces this descriptor.
+	"""
+
+	def __get__( self, instance, owner ):
+		try:
+			import pyhash
+		except ImportError:
+			algorithms = frozenset()
+		else:
+			algorithms = frozenset(
+				k for k in dir(pyhash)
+				if not k.startswith('_') and
+					not k.startswith('Test') and
+					isinstance(getattr(pyhash, k), type)
+			)
+
+		owner.algorithms_available = algorithms
+		return algorithms
+
+
 class pyhash_proxy:
 	"""Wraps the hash algorithms of 'pyhash' for use with 'hashset.build'."""
 
 	accepted_types = (bytes, str)
-	algorithms_available = frozenset()
+	algorithms_available = _pyhash_algorithms()
 	algorithms_preferred = (
 		'xx_64', 'murmur3_x64_128', 'murmur2_x64_64a' )
 
 
 	def __init__( self, hash_name ):
 		"""Wraps the named 'pyhash' algorithm."""
+		import pyhash
 		self.name = hash_name
 		self.hasher = getattr(pyhash, hash_name)()
 
@@ -70,17 +94,18 @@ class pyhash_proxy:
 		self.__init__(*state)
 
 
-try:
-	import pyhash
-	pyhash_proxy.algorithms_available = frozenset(
-		k for k in dir(pyhash)
-		if not k.startswith('_') and
-			not k.startswith('Test') and
-			isinstance(getattr(pyhash, k), type)
-	)
-	default_hasher = pyhash_proxy(next(iter(filter(
-		pyhash_proxy.algorithms_available.__contains__,
-		pyhash_proxy.algorithms_preferred))))
-
-except (ImportError, StopIteration):
-	default_hasher = hashlib_proxy('md5')
+def __getattr__( name ):
+	# The default hasher is chosen on first access since that requires a look
+	# into 'pyhash'.
+	if name == 'default_hasher':
+		global default_hasher
+		try:
+			default_hasher = pyhash_proxy(next(iter(filter(
+				pyhash_proxy.algorithms_available.__contains__,
+				pyhash_proxy.algorithms_preferred))))
+		except StopIteration:
+			default_hasher = hashlib_proxy('md5')
+		return default_hasher
+
+	raise AttributeError(
+		'module {!r} has no attribute {!r}'.format(__name__, name))
@@ -1,9 +1,11 @@
 import sys, math, itertools
-import struct, pickle
+import struct
 import hashset.util as util
 import hashset.util.iter as util_iter
 import hashset.util.functional as functional
 from functools import partial as fpartial
+from .bloom import bloom_filter
+from .mph import mph_table
 from .util.math import ceil_div, is_pow2, ceil_pow2
 
 
@@ -39,17 +41,41 @@ class header:
 
 	byteorder = sys.byteorder
 	_magic = b'hashset '
-	_version = 1
+	_versions = (1, 2)
 
 	_struct = struct.Struct('=BB 2x I')
 	_struct_keys = ('version', 'int_size', 'index_offset')
+
+	# Version 2 stores the variable header data in fixed binary fields instead
+	# of a pickled dictionary, so that the whole header is read at once without
+	# unpickling anything (see 'hashset.registry').
+	_v2_fields = 'QQQ I BBBBBB 2x I 32s 32s'
+	_v2_struct = struct.Struct('=' + _v2_fields)
+	_v2_full_struct = struct.Struct(_struct.format + ' ' + _v2_fields)
+	_v2_keys = (
+		'element_count', 'bucket_count', 'mph_buckets', 'bloom_bits_per_key',
+		'fingerprint_size', 'compression', 'hasher', 'pickler',
+		'pickler_flags', 'pickler_int_size', 'pickler_width', 'hasher_param',
+		'pickler_param')
 	_vardata_keys = {'element_count', 'bucket_count', 'hasher', 'pickler'}
-	vars().update({ k: _vardata_hook(k) for k in _vardata_keys })
+	_vardata_defaults = {
+		'bloom_bits_per_key': 0, 'mph_buckets': 0, 'compression': None,
+		'fingerprint_size': 0 }
+	vars().update({
+		k: _vardata_hook(k) for k in _vardata_keys | _vardata_defaults.keys() })
 
 	hasher.__doc__ = """The hasher to use for this hash set. (See 'hashset.build' for a description.)"""
 
 	pickler.__doc__ = """The pickler to use for this hash set. (See 'hashset.build' for a description.)"""
 
+	bloom_bits_per_key.__doc__ = """The number of Bloom filter bits per element, or 0 if there is no Bloom filter section."""
+
+	mph_buckets.__doc__ = """The number of entries of the minimal perfect hash displacement table, or 0 if the buckets are addressed by hash bits."""
+
+	compression.__doc__ = """The name of the codec that compresses the blocks of the value section, or None. (See 'hashset.compression'.)"""
+
+	fingerprint_size.__doc__ = """The size (in bytes) of the hash fingerprints stored in front of each bucket, or 0. (See 'hashset.fingerprint'.)"""
+
 
 	def __init__( self, hasher, pickler, int_size=0 ):
 		"""
@@ -61,10 +87,15 @@ class header:
 		self.index_offset = None
 
 		self._vardata = None
+		self._version = None
 		self._hasher = hasher
 		self._pickler = pickler
 		self._element_count = None
 		self._bucket_count = None
+		self._bloom_bits_per_key = self._vardata_defaults['bloom_bits_per_key']
+		self._mph_buckets = self._vardata_defaults['mph_buckets']
+		self._compression = self._vardata_defaults['compression']
+		self._fingerprint_size = self._vardata_defaults['fingerprint_size']
 
 
 	@util.property_setter
@@ -80,6 +111,20 @@ class header:
 	def reevaluate( self ):
 		"""Resets cached derived attributes in case their source changed."""
 		self._vardata = None
+		self._version = None
+
+
+	@property
+	def version( self ):
+		"""The format version of this header…
+
+		2 if the hasher and pickler are registered in 'hashset.registry' and 1
+		otherwise.
+		"""
+
+		if self._version is None:
+			self.vardata()
+		return self._version
 
 
 	def vardata( self, force=False ):
@@ -98,17 +143,83 @@ class header:
 					'One or more of \'{}\' were never assigned'
 						.format('\', \''.join(self._vardata_keys)))
 
-			self._vardata = pickle.dumps(dict(map(
-				functional.project_out(functional.identity, self_getattr),
-				self._vardata_keys)))
+			fields = self._v2_vardata_fields()
+			if fields is not None:
+				self._vardata = self._v2_struct.pack(*fields)
+				self._version = 2
+			else:
+				import pickle
+				# Optional entries are only stored if they differ from their default.
+				keys = itertools.chain(self._vardata_keys,
+					(k for k, v in self._vardata_defaults.items() if self_getattr(k) != v))
+				self._vardata = pickle.dumps(dict(map(
+					functional.project_out(functional.identity, self_getattr), keys)))
+				self._version = 1
 
 		return self._vardata
 
 
+	def _v2_vardata_fields( self ):
+		"""Returns the values of the version-2 header fields in the order of '_v2_keys' or None if they can't describe this header."""
+
+		from . import registry, compression
+
+		hasher = registry.describe_hasher(self.hasher)
+		pickler = registry.describe_pickler(self.pickler)
+		if (hasher is None or pickler is None or
+			self.bloom_bits_per_key >= 1 << 32 or
+			self.compression not in (None,) + compression.codecs
+		):
+			return None
+
+		compression_id = (
+			0 if self.compression is None else
+			compression.codecs.index(self.compression) + 1)
+		pid, flags, int_size, width, pickler_param = pickler
+		return (
+			self.element_count, self.bucket_count, self.mph_buckets,
+			self.bloom_bits_per_key, self.fingerprint_size, compression_id,
+			hasher[0], pid, flags, int_size, width, hasher[1], pickler_param)
+
+
 	def hash( self, obj ):
 		return self.hasher(obj, self.pickler.dump_single)
 
 
+	def hash_converted( self, obj, converted ):
+		"""Returns the hash of an item like 'hash' from its form converted by 'bytes_pickler.dump_single_convert'…
+
+		so that hashers that need the encoded item don't convert it again.
+		"""
+		return self.hasher(obj,
+			lambda _: self.pickler.dump_single_converted(converted))
+
+
+	def bloom_offset( self ):
+		"""Returns the offset of the Bloom filter section which is aligned to its block size."""
+		return util.pad_multiple_of(
+			len(self._magic) + self._struct.size + len(self.vardata()),
+			bloom_filter.block_size)
+
+
+	def bloom_size( self ):
+		"""Returns the size of the Bloom filter section."""
+		return bloom_filter.size_for(self.element_count, self.bloom_bits_per_key)
+
+
+	def mph_offset( self ):
+		"""Returns the offset of the minimal perfect hash displacement table which follows the Bloom filter section, if any."""
+		offset = len(self._magic) + self._struct.size + len(self.vardata())
+		if self.bloom_bits_per_key:
+			offset = self.bloom_offset() + self.bloom_size()
+		return util.pad_multiple_of(offset, 8)
+
+
+	def mph_size( self ):
+		"""Returns the size of the minimal perfect hash displacement table."""
+		return mph_table.size_for(self.bucket_count, self.mph_buckets)
+
+
 	def value_offset( self ):
 		"""Returns the offset of the content section of the buffer prefixed by this header."""
 		return self.index_offset + self.bucket_count * self.int_size
@@ -134,32 +245,37 @@ class header:
 		raise RuntimeError('Unknown byte order: {!r}'.format(cls.byteorder))
 
 
-	def calculate_sizes( self, buckets=None, force=False ):
+	def calculate_sizes( self, buckets=None, force=False, value_size=None ):
 		"""Performs some internal calculations before writing this header to a buffer.
 
-		If given a list of buckets, some paramters may be set to more suitable
-		values toa void later issues.
+		If given a list of buckets or the total size of the value section, some
+		paramters may be set to more suitable values toa void later issues.
 		"""
 
 		# Calculate int_size
-		if self.int_size <= 0 and buckets is not None:
-			max_int = sum(map(len, buckets))
-			self.int_size = ceil_pow2(ceil_div(max_int.bit_length(), 8))
-			assert 0 <= self.int_size <= 0xFF
+		if self.int_size <= 0:
+			if value_size is None and buckets is not None:
+				value_size = sum(map(len, buckets))
+			if value_size is not None:
+				self.int_size = ceil_pow2(max(ceil_div(value_size.bit_length(), 8), 1))
+				assert 0 < self.int_size <= 0xFF
 
 		# Calculate index offset
-		self.index_offset = util.pad_multiple_of(
-			len(self._magic) + self._struct.size + len(self.vardata(force)),
-			self.int_size)
+		offset = len(self._magic) + self._struct.size + len(self.vardata(force))
+		if self.mph_buckets:
+			offset = self.mph_offset() + self.mph_size()
+		elif self.bloom_bits_per_key:
+			offset = self.bloom_offset() + self.bloom_size()
+		self.index_offset = util.pad_multiple_of(offset, self.int_size)
 
 
-	def to_bytes( self, buf=None, buckets=None ):
+	def to_bytes( self, buf=None, buckets=None, value_size=None ):
 		"""Writes this header to a newly created or the given buffer and returns it.
 
-		'buckets' is handed to 'calculate_sizes' if given.
+		'buckets' and 'value_size' are handed to 'calculate_sizes' if given.
 		"""
 
-		self.calculate_sizes(buckets)
+		self.calculate_sizes(buckets, value_size=value_size)
 
 		if buf is None:
 			buf = bytearray(self.index_offset)
@@ -167,7 +283,7 @@ class header:
 		magic = self.get_magic()
 		buf[:len(magic)] = magic
 		self._struct.pack_into(buf, len(magic),
-			self._version, self.int_size, self.index_offset)
+			self.version, self.int_size, self.index_offset)
 
 		vardata = self.vardata()
 		vardata_offset = len(magic) + self._struct.size
@@ -186,23 +302,57 @@ class header:
 			raise ValueError(
 				'Unknown magic {!r}, expected {!r}'.format(magic, expected_magic))
 
+		version = b[len(magic)]
+		if version == 2:
+			return cls._from_v2_bytes(b, len(magic))
+		if version not in cls._versions:
+			raise ValueError(
+				'Unsupported version {:d}, expected one of: {}'.format(
+					version, ', '.join(map(str, cls._versions))))
+
 		s = cls._struct.unpack_from(b, len(magic))
 		assert len(s) == len(cls._struct_keys)
 		s = dict(zip(cls._struct_keys, s))
+		del s['version']
 
-		version = s.pop('version')
-		if version != cls._version:
-			raise ValueError(
-				'Unsupported version {:d}, expected {:d}'.format(
-					version, cls._version))
-
+		import pickle
 		var = pickle.loads(
 			b[ len(magic) + cls._struct.size : s['index_offset'] ])
-		if cls._vardata_keys != var.keys():
+		mismatch = (
+			(cls._vardata_keys - var.keys()) |
+			(var.keys() - cls._vardata_keys - cls._vardata_defaults.keys()))
+		if mismatch:
 			raise ValueError('Header field mismatch: {}'
-				.format(', '.join(cls._vardata_keys ^ var.keys())))
+				.format(', '.join(mismatch)))
 
 		h = cls(None, None)
 		util_iter.stareach(fpartial(setattr, h),
 			itertools.chain(s.items(), var.items()))
 		return h
+
+
+	@classmethod
+	def _from_v2_bytes( cls, b, offset ):
+		from . import registry, compression
+
+		s = cls._v2_full_struct.unpack_from(b, offset)
+		_, int_size, index_offset = s[:len(cls._struct_keys)]
+		var = dict(zip(cls._v2_keys, s[len(cls._struct_keys):]))
+
+		compression_id = var.pop('compression')
+		if compression_id > len(compression.codecs):
+			raise ValueError(
+				'Unknown compression codec ID {:d}'.format(compression_id))
+
+		h = cls(
+			registry.load_hasher(var.pop('hasher'), var.pop('hasher_param')),
+			registry.load_pickler(var.pop('pickler'), var.pop('pickler_flags'),
+				var.pop('pickler_int_size'), var.pop('pickler_width'),
+				var.pop('pickler_param')),
+			int_size)
+		h.index_offset = index_offset
+		h._compression = (
+			compression.codecs[compression_id - 1] if compression_id else None)
+		util_iter.stareach(fpartial(setattr, h),
+			(('_' + k, v) for k, v in var.items()))
+		return h
@@ -0,0 +1,110 @@
+"""Minimal perfect hash functions over the item hashes of a hash set."""
+
+import math, array, itertools
+from .util.math import mix64
+
+
+_hash_mask = (1 << 64) - 1
+_golden = 0x9e3779b97f4a7c15
+
+
+class mph_table:
+	"""Maps the hashes of a fixed set of n items to distinct slots 0 to n-1…
+
+	in the manner of “hash and displace” (CHD). The upper half of the lower 64
+	bits of a hash select an entry of a displacement table. Non-negative entries
+	are seeds that are mixed into the hash to derive the slot; a negative entry
+	is the complement of the slot of the only item with that hash.
+
+	Lookups of items outside of the original set yield arbitrary slots.
+	"""
+
+	load = 2
+	max_seed = 1 << 20
+
+
+	def __init__( self, displacements, slot_count ):
+		"""Initializes a table from a sequence of signed integers and the number of slots."""
+		self.displacements = displacements
+		self.slot_count = slot_count
+
+
+	@staticmethod
+	def typecode_for( slot_count ):
+		"""Returns the array type code of the displacement entries for a number of slots."""
+		return 'i' if slot_count < 1 << 31 else 'q'
+
+
+	@classmethod
+	def size_for( cls, slot_count, bucket_count ):
+		"""Returns the size (in bytes) of a displacement table."""
+		return bucket_count * array.array(cls.typecode_for(slot_count)).itemsize
+
+
+	def slot( self, h ):
+		"""Returns the slot for a hash."""
+		h &= _hash_mask
+		d = self.displacements[(h >> 32) % len(self.displacements)]
+		if d < 0:
+			return ~d
+		return mix64(h ^ d * _golden) % self.slot_count
+
+
+	@classmethod
+	def build( cls, hashes ):
+		"""Builds a table for a sequence of distinct hashes.
+
+		Returns the table and an array with the position of the hash in
+		'hashes' for each slot. Raises a ValueError if two hashes are equal in
+		their lower 64 bits.
+		"""
+
+		n = len(hashes)
+		hashes = array.array('Q', (h & _hash_mask for h in hashes))
+		bucket_count = max(math.ceil(n / cls.load), 1) if n else 0
+		groups = [[] for _ in range(bucket_count)]
+		for i, h in enumerate(hashes):
+			groups[(h >> 32) % bucket_count].append(i)
+
+		displacements = array.array(cls.typecode_for(n), bytes(
+			cls.size_for(n, bucket_count)))
+		owners = array.array('q', itertools.repeat(-1, n))
+		order = sorted(range(bucket_count), key=lambda b: len(groups[b]),
+			reverse=True)
+
+		# Place the larger groups first while most slots are still free.
+		singles = len(order)
+		for k, b in enumerate(order):
+			group = groups[b]
+			if len(group) <= 1:
+				singles = k
+				break
+			displacements[b] = cls._find_seed(
+				[ hashes[i] for i in group ], owners, n)
+			for i in group:
+				owners[mix64(hashes[i] ^ displacements[b] * _golden) % n] = i
+
+		# Assign the remaining free slots to single items directly.
+		free = itertools.compress(itertools.count(), map((-1).__eq__, owners))
+		for b in itertools.islice(order, singles, None):
+			group = groups[b]
+			if not group:
+				break
+			s = next(free)
+			displacements[b] = ~s
+			owners[s] = group[0]
+
+		return cls(displacements, n), owners
+
+
+	@classmethod
+	def _find_seed( cls, group, owners, n ):
+		if len(set(group)) < len(group):
+			raise ValueError('Two items have the same 64-bit hash')
+
+		for d in range(cls.max_seed):
+			slots = { mix64(h ^ d * _golden) % n for h in group }
+			if len(slots) == len(group) and all(owners[s] < 0 for s in slots):
+				return d
+		raise ValueError(
+			'Found no displacement for a group of {:d} items'.format(len(group)))
@@ -1,7 +1,8 @@
-import sys
-import locale, codecs
+import sys, itertools
+import codecs
+import hashset.util.iter as util_iter
 from .header import header
-from .util.math import ceil_div
+from .util.math import ceil_div, ceil_pow2
 
 
 def _slice( buf, offset=0, length=None ):
@@ -23,30 +24,69 @@ class bytes_pickler:
 
 	as well as sequences (“buckets”) of such sequences for use with
 	'hashset.build'.
+
+	By default a bucket is the concatenation of its length-prefixed entries. If
+	'sorted_buckets' is true, a bucket starts with the size of its table
+	integers (1 byte), its entry count and a table of entry offsets followed by
+	its entries, without length prefixes, in ascending byte order. This allows
+	lookups by binary search.
 	"""
 
-	def __init__( self, list_ctor=list, int_size=0, byteorder=header.byteorder ):
+	sorted_buckets = False
+
+
+	def __init__( self, list_ctor=list, int_size=0, byteorder=header.byteorder,
+		sorted_buckets=False
+	):
 		"""Initializes a new instance …
 
 		with 'list_ctor' the constructor to build new buckets when decoding,
 		'int_size' and 'byteorder' the size in bytes and byte order of integers
-		used to encode the length of byte sequences as accepted by 'int.to_bytes'.
+		used to encode the length of byte sequences as accepted by 'int.to_bytes',
+		and 'sorted_buckets' the bucket layout.
 		"""
 		self.list_ctor = list_ctor
 		self.int_size = int_size
 		self.byteorder = byteorder
+		self.sorted_buckets = sorted_buckets
 
 
 	def dump_single( self, obj ):
-		obj = self.dump_single_convert(obj)
-		return self._to_bytes(len(obj)) + obj
+		return self.dump_single_converted(self.dump_single_convert(obj))
 
 	def dump_single_convert( self, obj ):
 		return obj
 
+	def dump_single_converted( self, converted ):
+		"""Returns what 'dump_single' returns for an item that was converted with 'dump_single_convert' already."""
+		return self._to_bytes(len(converted)) + converted
+
 
 	def dump_bucket( self, obj ):
-		return b''.join(map(self.dump_single, obj))
+		return self.join_bucket(map(self.dump_single_convert, obj))
+
+
+	def join_bucket( self, items ):
+		"""Encodes a bucket from items that were converted with 'dump_single_convert'."""
+
+		if self.sorted_buckets:
+			return self._join_sorted_bucket(items)
+
+		return b''.join(itertools.chain.from_iterable(
+			(self._to_bytes(len(item)), item) for item in items))
+
+
+	def _join_sorted_bucket( self, items ):
+		items = sorted(map(bytes, items))
+		data_length = sum(map(len, items))
+		int_size = ceil_pow2(
+			max(self.get_int_size_for_val(max(len(items), data_length)), 1))
+		to_bytes = lambda n: n.to_bytes(int_size, self.byteorder)
+
+		return b''.join(itertools.chain(
+			(bytes((int_size,)), to_bytes(len(items))),
+			map(to_bytes, util_iter.accumulate(map(len, items[:-1]), 0)),
+			items))
 
 
 	def load_single( self, buf, offset=0 ):
@@ -61,6 +101,11 @@ class bytes_pickler:
 		return self.list_ctor(self._load_list_gen(buf, offset, length))
 
 	def _load_list_gen( self, buf, offset, length=None ):
+		if self.sorted_buckets:
+			for start, stop in self._sorted_extents(buf, offset, length):
+				yield self.load_single_convert(buf, start, stop - start)
+			return
+
 		end = len(buf) if length is None else offset + length
 		while offset < end:
 			length = self._get_length(buf, offset)
@@ -69,17 +114,89 @@ class bytes_pickler:
 			offset += length
 
 
+	def _sorted_layout( self, buf, offset, length=None ):
+		"""Returns the entry count, the table integer size, the table offset, and the data offset and end of a sorted bucket."""
+		int_size = buf[offset]
+		count = self._get_int(buf, offset + 1, int_size)
+		table = offset + 1 + int_size
+		end = len(buf) if length is None else offset + length
+		return count, int_size, table, table + count * int_size, end
+
+
+	def _sorted_entry_extent( self, buf, i, layout ):
+		count, int_size, table, data, end = layout
+		table += i * int_size
+		start = data + self._get_int(buf, table, int_size)
+		if i + 1 < count:
+			end = data + self._get_int(buf, table + int_size, int_size)
+		return start, end
+
+
+	def _sorted_extents( self, buf, offset, length=None ):
+		layout = self._sorted_layout(buf, offset, length)
+		for i in range(layout[0]):
+			yield self._sorted_entry_extent(buf, i, layout)
+
+
+	def bucket_contains( self, buf, offset, length, needle ):
+		"""Tests if an encoded bucket contains an item without decoding the bucket.
+
+		'needle' is the item as returned by 'dump_single_convert'. Only the
+		length prefixes of the bucket entries are parsed; entries of the same
+		length as the needle are compared to it byte-wise in place. Sorted buckets
+		are binary-searched instead.
+		"""
+
+		if self.sorted_buckets:
+			return self._sorted_bucket_contains(buf, offset, length, needle)
+
+		needle_length = len(needle)
+		end = offset + length
+		while offset < end:
+			length = self._get_length(buf, offset)
+			offset += self.int_size
+			if length == needle_length and buf[offset : offset + length] == needle:
+				return True
+			offset += length
+		return False
+
+
+	def _sorted_bucket_contains( self, buf, offset, length, needle ):
+		needle = bytes(needle)
+		layout = self._sorted_layout(buf, offset, length)
+		lo, hi = 0, layout[0]
+		while lo < hi:
+			mid = (lo + hi) // 2
+			start, stop = self._sorted_entry_extent(buf, mid, layout)
+			entry = bytes(buf[start:stop])
+			if entry < needle:
+				lo = mid + 1
+			elif entry > needle:
+				hi = mid
+			else:
+				return True
+		return False
+
+
 	def run_estimates( self, items, force=False ):
 		if force or self.int_size <= 0:
 			longest = max(items, key=len, default=None)
 			if longest is not None:
-				self.int_size = max(
-					self.get_int_size_for_val(len(self.dump_single_convert(longest))),
-					1)
+				self.fit_length(len(self.dump_single_convert(longest)), True)
+
+
+	def fit_length( self, length, force=False ):
+		"""Adjusts the encoding parameters to entries of a given maximum (encoded) length."""
+		if force or self.int_size <= 0:
+			self.int_size = max(self.get_int_size_for_val(length), 1)
 
 
 	def _get_length( self, buf, offset=0 ):
-		return int.from_bytes(_slice(buf, offset, self.int_size), self.byteorder)
+		return self._get_int(buf, offset, self.int_size)
+
+
+	def _get_int( self, buf, offset, size ):
+		return int.from_bytes(_slice(buf, offset, size), self.byteorder)
 
 
 	def _to_bytes( self, n ):
@@ -151,6 +268,7 @@ class codec_pickler(bytes_pickler):
 		taken from locale.getpreferredencoding."""
 
 		if codec is None:
+			import locale
 			codec = locale.getpreferredencoding(False)
 
 		return cls(codec, *args, **kwargs)
@@ -169,6 +287,164 @@ class codec_pickler(bytes_pickler):
 		self.__init__(codec, **state)
 
 
+#####################################################################
+
+class fixed_width_pickler(codec_pickler):
+	"""Like its parent, but for items that all encode to the same number of bytes…
+
+	e. g. hexadecimal digests. Entries have no length prefix; a bucket is the
+	concatenation of its entries, in ascending byte order if 'sorted_buckets'
+	is true. The offset of every entry follows from its position in the bucket
+	and the entry width.
+	"""
+
+	def __init__( self, codec, external_encoding=None, *args, width=0,
+		**kwargs
+	):
+		"""Initializes a new instance with a codec and an entry width (in bytes)…
+
+		which, if 0, is derived from the first estimation run. Other arguments
+		are forwarded to the parent constructor.
+		"""
+
+		super().__init__(codec, external_encoding, *args, **kwargs)
+		self.int_size = 0
+		self.width = width
+
+
+	def dump_single_converted( self, converted ):
+		return converted
+
+
+	def join_bucket( self, items ):
+		items = sorted(map(bytes, items)) if self.sorted_buckets else list(items)
+		for item in items:
+			if len(item) != self.width:
+				raise PickleError(
+					'An encoded item has a length of {:d} bytes instead of {:d}'
+						.format(len(item), self.width))
+		return b''.join(items)
+
+
+	def load_single( self, buf, offset=0 ):
+		return self.load_single_convert(buf, offset, self.width)
+
+
+	def _load_list_gen( self, buf, offset, length=None ):
+		end = len(buf) if length is None else offset + length
+		for offset in range(offset, end, self.width):
+			yield self.load_single_convert(buf, offset, self.width)
+
+
+	def bucket_contains( self, buf, offset, length, needle ):
+		"""Tests if an encoded bucket contains an item without decoding the bucket.
+
+		Unsorted buckets are searched for the needle as a whole; only matches at
+		entry boundaries count. Sorted buckets are binary-searched.
+		"""
+
+		width = self.width
+		if len(needle) != width:
+			return False
+
+		if self.sorted_buckets:
+			needle = bytes(needle)
+			lo, hi = 0, length // width
+			while lo < hi:
+				mid = (lo + hi) // 2
+				start = offset + mid * width
+				entry = bytes(buf[start : start + width])
+				if entry < needle:
+					lo = mid + 1
+				elif entry > needle:
+					hi = mid
+				else:
+					return True
+			return False
+
+		data = bytes(buf[offset : offset + length])
+		i = data.find(needle)
+		while i >= 0:
+			if not i % width:
+				return True
+			i = data.find(needle, i + 1)
+		return False
+
+
+	def run_estimates( self, items, force=False ):
+		if force or self.width <= 0:
+			first = next(iter(items), None)
+			if first is not None:
+				self.fit_length(len(self.dump_single_convert(first)), True)
+
+
+	def fit_length( self, length, force=False ):
+		"""Sets the entry width unless it's set already."""
+		if force or self.width <= 0:
+			self.width = length
+
+
+#####################################################################
+
+class front_coded_pickler(codec_pickler):
+	"""Like its parent, but stores the entries of a bucket front-coded…
+
+	i. e. in ascending byte order, each as the length of the prefix it shares
+	with its predecessor and the length of the remaining suffix, both of
+	'int_size' bytes, followed by the suffix. This suits items with common
+	prefixes like URLs or domain names. The 'sorted_buckets' setting is
+	ignored.
+	"""
+
+	def join_bucket( self, items ):
+		parts = []
+		prev = b''
+		for item in sorted(map(bytes, items)):
+			prefix = 0
+			for a, b in zip(prev, item):
+				if a != b:
+					break
+				prefix += 1
+			parts += (
+				self._to_bytes(prefix), self._to_bytes(len(item) - prefix),
+				item[prefix:])
+			prev = item
+		return b''.join(parts)
+
+
+	def _iter_entries( self, buf, offset, length=None ):
+		"""Reconstructs the encoded entries of a bucket one after another."""
+		end = len(buf) if length is None else offset + length
+		int_size = self.int_size
+		entry = b''
+		while offset < end:
+			prefix = self._get_length(buf, offset)
+			suffix = self._get_length(buf, offset + int_size)
+			offset += 2 * int_size
+			entry = entry[:prefix] + bytes(buf[offset : offset + suffix])
+			offset += suffix
+			yield entry
+
+
+	def _load_list_gen( self, buf, offset, length=None ):
+		for entry in self._iter_entries(buf, offset, length):
+			yield codec_pickler.load_single_convert(self, entry, 0, len(entry))
+
+
+	def bucket_contains( self, buf, offset, length, needle ):
+		"""Tests if an encoded bucket contains an item without decoding the bucket.
+
+		The entries are reconstructed in order until one is equal to or greater
+		than the needle.
+		"""
+
+		needle = bytes(needle)
+		for entry in self._iter_entries(buf, offset, length):
+			if entry >= needle:
+				return entry == needle
+		return False
+
+
 #####################################################################
 
 class pickle_proxy:
@@ -0,0 +1,108 @@
+"""A lightweight entry point that probes a hash set file, for frequent invocation from shell pipelines.
+
+usage: python3 -m hashset.probe [-q] [--encoding CHARSET] [--batch-size N]
+                                HASHSET-FILE [ITEM ...]
+
+It behaves like the '--probe' action of 'python3 -m hashset' but doesn't
+import 'argparse' or anything else that the probe doesn't need. The external
+encoding defaults to that of standard input.
+"""
+
+import sys, os, itertools
+from functools import partial as fpartial
+from . import hashset
+from .picklers import codec_pickler
+import hashset.util.io as util_io
+import hashset.util.iter as util_iter
+
+
+_usage = __doc__.split('\n\n')[1]
+
+
+def _parse_args( args ):
+	quiet = False
+	encoding = None
+	batch_size = 0
+	args = list(args)
+	while args and args[0].startswith('-') and args[0] != '-':
+		opt = args.pop(0)
+		if opt == '--':
+			break
+		if opt.startswith('--') and '=' in opt:
+			opt, value = opt.split('=', 1)
+			args.insert(0, value)
+		if opt in ('-q', '--quiet'):
+			quiet = True
+		elif opt in ('--encoding', '--external-encoding') and args:
+			encoding = args.pop(0)
+		elif opt == '--batch-size' and args:
+			batch_size = int(args.pop(0))
+		else:
+			raise ValueError('Unknown option or missing argument: {!r}'.format(opt))
+	if not args:
+		raise ValueError('Missing hash set file')
+	return quiet, encoding, batch_size, args[0], args[1:]
+
+
+def probe( in_path, needles=(), quiet=False, encoding=None, batch_size=0 ):
+	"""Probes some items in a hash set file, or those read from standard input…
+
+	and prints the contained ones unless 'quiet' is true. Returns whether any
+	of them were found.
+	"""
+
+	if encoding is None:
+		# Unlike 'locale' this doesn't require any further imports unless standard
+		# input is closed.
+		if sys.stdin is not None:
+			encoding = sys.stdin.encoding
+		else:
+			import locale
+			encoding = locale.getpreferredencoding()
+
+	with hashset(in_path) as _set:
+		pickler = _set.header.pickler
+		bypass = (
+			isinstance(pickler, codec_pickler) and pickler.set_bypass_for(encoding))
+		# In bypass mode the pickler expects items already encoded with its codec.
+		encode = (lambda s: pickler.codec.encode(s)[0]) if bypass else None
+		linesep = encode(os.linesep) if bypass else os.linesep
+		stream_encoding = 'binary' if bypass else encoding
+
+		if needles:
+			if bypass:
+				needles = map(encode, needles)
+		else:
+			needles = map(
+				fpartial(util_io.strip_line_terminator, linesep=linesep),
+				util_io.open_stdstream('stdin', stream_encoding))
+
+		if batch_size > 0:
+			contained = itertools.chain.from_iterable(map(
+				fpartial(_set.contains_many, items=True),
+				util_iter.chunked(needles, batch_size)))
+		else:
+			contained = filter(_set.__contains__, needles)
+		if quiet:
+			return any(True for _ in contained)
+
+		with util_io.open_stdstream('stdout', stream_encoding) as f_out:
+			def println( item ):
+				f_out.write(item)
+				f_out.write(linesep)
+			return util_iter.each(println, contained)
+
+
+def main( args ):
+	try:
+		quiet, encoding, batch_size, in_path, needles = _parse_args(args)
+	except ValueError as ex:
+		print(_usage, ex, sep='\n', file=sys.stderr)
+		sys.exit(2)
+
+	if not probe(in_path, needles, quiet, encoding, batch_size):
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,119 @@
+"""Numeric IDs of the hashers and picklers that version-2 headers describe without pickling them.
+
+A hasher is described by its ID and its algorithm name. A pickler is
+described by its ID, some flags, its integer size, its entry width and its
+codec name. Names are ASCII strings of up to 'param_size' bytes. Hashers and
+picklers that can't be described this way, e. g. instances of other classes,
+require a version-1 header.
+"""
+
+import codecs
+from .hashers import hashlib_proxy, pyhash_proxy
+from .picklers import (
+	bytes_pickler, codec_pickler, fixed_width_pickler, front_coded_pickler,
+	pickle_proxy)
+
+
+param_size = 32
+
+SORTED_BUCKETS = 1
+BIG_ENDIAN = 2
+
+hashers = {
+	1: hashlib_proxy,
+	2: pyhash_proxy,
+}
+
+picklers = {
+	1: codec_pickler,
+	2: fixed_width_pickler,
+	3: front_coded_pickler,
+	4: bytes_pickler,
+	5: pickle_proxy,
+}
+
+_hasher_ids = { v: k for k, v in hashers.items() }
+_pickler_ids = { v: k for k, v in picklers.items() }
+
+
+def _encode_param( s ):
+	try:
+		b = s.encode('ascii')
+	except UnicodeEncodeError:
+		return None
+	return b if len(b) <= param_size else None
+
+
+def _decode_param( b ):
+	return b.rstrip(b'\0').decode('ascii')
+
+
+def describe_hasher( hasher ):
+	"""Returns the ID and parameter of a hasher or None if it isn't registered."""
+	hid = _hasher_ids.get(type(hasher))
+	if hid is None:
+		return None
+	param = _encode_param(hasher.name)
+	return None if param is None else (hid, param)
+
+
+def describe_pickler( pickler ):
+	"""Returns the ID, flags, integer size, entry width and parameter of a pickler or None if it isn't registered."""
+
+	pid = _pickler_ids.get(type(pickler))
+	if pid is None:
+		return None
+
+	if pid == 5:
+		import pickle
+		if (pickler.dump_single is not pickle.dumps or
+			pickler.load_single is not pickle.loads
+		):
+			return None
+		return pid, 0, 0, 0, b''
+
+	if pickler.list_ctor is not list or pickler.byteorder not in ('little', 'big'):
+		return None
+	flags = (
+		(SORTED_BUCKETS if pickler.sorted_buckets else 0) |
+		(BIG_ENDIAN if pickler.byteorder == 'big' else 0))
+
+	param = b''
+	if isinstance(pickler, codec_pickler):
+		param = _encode_param(getattr(pickler.codec, 'name', pickler.codec))
+		if param is None:
+			return None
+
+	return (pid, flags, pickler.int_size, getattr(pickler, 'width', 0), param)
+
+
+def load_hasher( hid, param ):
+	"""Constructs a hasher from its ID and parameter."""
+	try:
+		hasher_type = hashers[hid]
+	except KeyError:
+		raise ValueError('Unknown hasher ID {:d}'.format(hid))
+	return hasher_type(_decode_param(param))
+
+
+def load_pickler( pid, flags, int_size, width, param ):
+	"""Constructs a pickler from its ID, flags, integer size, entry width and parameter."""
+
+	try:
+		pickler_type = picklers[pid]
+	except KeyError:
+		raise ValueError('Unknown pickler ID {:d}'.format(pid))
+
+	if pickler_type is pickle_proxy:
+		import pickle
+		return pickle_proxy(pickle)
+
+	kwargs = dict(int_size=int_size, sorted_buckets=bool(flags & SORTED_BUCKETS),
+		byteorder='big' if flags & BIG_ENDIAN else 'little')
+	if pickler_type is bytes_pickler:
+		return bytes_pickler(**kwargs)
+	if pickler_type is fixed_width_pickler:
+		kwargs['width'] = width
+	pickler = pickler_type(codecs.lookup(_decode_param(param)), **kwargs)
+	pickler.int_size = int_size
+	return pickler
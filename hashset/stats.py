@@ -0,0 +1,114 @@
+"""Runtime statistics of the probes of a hash set (see the 'stats' argument of the 'hashset' constructor)."""
+
+import time, collections.abc
+
+
+class probe_stats:
+	"""Counts the work done by the probes of a hash set…
+
+	and keeps the cumulative time spent hashing items and decoding buckets.
+	The counters are updated without locking, so they're approximate for hash
+	sets that are probed from several threads at once.
+
+	  * 'probes', 'hits' and 'misses' count membership tests;
+	  * 'bloom_rejects' and 'fingerprint_rejects' count the misses that the
+	    Bloom filter or the bucket fingerprints decided;
+	  * 'cache_hits' counts probes of buckets that were decoded already;
+	  * 'bucket_decodes' and 'bytes_decoded' count the buckets decoded from the
+	    value section and their encoded size;
+	  * 'in_place_scans' and 'bytes_scanned' count the buckets that were
+	    searched without decoding them and their encoded size;
+	  * 'entries_compared' counts the decoded entries that were compared to a
+	    needle;
+	  * 'hash_calls', 'hash_time' and 'decode_time' cover the calls of
+	    'header.hash' by probes and of 'pickler.load_bucket'.
+	"""
+
+	counters = (
+		'probes', 'hits', 'misses', 'bloom_rejects', 'fingerprint_rejects',
+		'cache_hits', 'bucket_decodes', 'bytes_decoded', 'in_place_scans',
+		'bytes_scanned', 'entries_compared', 'hash_calls')
+
+	timers = ('hash_time', 'decode_time')
+
+	clock = staticmethod(time.perf_counter)
+
+
+	def __init__( self ):
+		self.reset()
+
+
+	def reset( self ):
+		for name in self.counters:
+			setattr(self, name, 0)
+		for name in self.timers:
+			setattr(self, name, 0.0)
+
+
+	def as_dict( self ):
+		"""Returns the counters and timers by name along with their averages per probe."""
+
+		d = { name: getattr(self, name) for name in self.counters + self.timers }
+		for name in ('entries_compared', 'bytes_decoded', 'bytes_scanned',
+			'hash_time', 'decode_time'
+		):
+			d[name + '_per_probe'] = d[name] / self.probes if self.probes else 0.0
+		return d
+
+
+	def count( self, contained ):
+		"""Counts a probe and returns its result."""
+		self.probes += 1
+		if contained:
+			self.hits += 1
+		else:
+			self.misses += 1
+		return contained
+
+
+	def count_many( self, mask ):
+		hits = sum(map(bool, mask))
+		self.probes += len(mask)
+		self.hits += hits
+		self.misses += len(mask) - hits
+
+
+	def count_compared( self, bucket, obj ):
+		"""Counts the entries of a decoded bucket that a membership test of an object compares to it."""
+		if isinstance(bucket, collections.abc.Set):
+			n = 1 if bucket else 0
+		else:
+			try:
+				n = bucket.index(obj) + 1
+			except ValueError:
+				n = len(bucket)
+		self.entries_compared += n
+
+
+	def timed_hash( self, func, obj ):
+		"""Calls a hash function on an object and counts and times it."""
+		start = self.clock()
+		try:
+			return func(obj)
+		finally:
+			self.hash_time += self.clock() - start
+			self.hash_calls += 1
+
+
+	def timed_decode( self, load_bucket, buf, offset, length ):
+		"""Calls a bucket decoder and counts and times it."""
+		start = self.clock()
+		try:
+			return load_bucket(buf, offset, length)
+		finally:
+			self.decode_time += self.clock() - start
+			self.bucket_decodes += 1
+			self.bytes_decoded += length
+
+
+	def format( self ):
+		"""Returns the statistics as lines of names and values."""
+		return '\n'.join(
+			'{:<28} {}'.format(name,
+				'{:.6f}'.format(value) if isinstance(value, float) else value)
+			for name, value in self.as_dict().items())
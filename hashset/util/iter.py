@@ -88,3 +88,9 @@ def iconditional( iterable, pred=bool, func_true=identity,
 		func_false = lambda x: val_false
 
 	return (func_true(x) if pred(x) else func_false(x) for x in iterable)
+
+
+def chunked( iterable, size ):
+	"""Returns an iterator over tuples of up to 'size' consecutive items of 'iterable'."""
+	iterable = iter(iterable)
+	return iter(lambda: tuple(itertools.islice(iterable, size)), ())
@@ -11,3 +11,12 @@ def ceil_pow2( n ):
 def ceil_div( numerator, denominator ):
 	"""Returns the “ceil” quotient of the numerator and the denominator."""
 	return -(-numerator // denominator)
+
+
+def mix64( h ):
+	"""Scrambles the bits of a 64-bit integer with the finalizer of splitmix64."""
+	m = (1 << 64) - 1
+	h &= m
+	h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & m
+	h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & m
+	return h ^ (h >> 31)
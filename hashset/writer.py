@@ -0,0 +1,108 @@
+"""Writes hash set files section by section."""
+
+import itertools
+import hashset.util.iter as util_iter
+from . import compression, fingerprint
+
+
+_hash_mask = (1 << 64) - 1
+
+
+def make_entries( header, bucket, hashes=True ):
+	"""Returns the entries of a bucket of items for 'encode_entries'…
+
+	i. e. triples of each item, its hash (or None unless 'hashes' is true) and
+	its converted form (see 'bytes_pickler.dump_single_convert', or None if the
+	pickler doesn't convert items individually).
+	"""
+
+	convert = getattr(header.pickler, 'dump_single_convert', None)
+	return [
+		(item, header.hash(item) if hashes else None,
+			None if convert is None else convert(item))
+		for item in bucket ]
+
+
+def record_hashes( buckets, hashes ):
+	"""Passes buckets of entries (see 'make_entries') through and appends the lower 64 bits of their hashes to an array…
+
+	of type code 'Q' after emptying it. The Bloom filter and the fingerprints
+	only use those bits.
+	"""
+
+	del hashes[:]
+	for bucket in buckets:
+		hashes.extend(e[1] & _hash_mask for e in bucket)
+		yield bucket
+
+
+def restore_hashes( buckets, hashes ):
+	"""Returns the same buckets of entries as those passed to 'record_hashes' from their entries without hashes and the recorded hashes."""
+	hashes = iter(hashes)
+	return (
+		[ (item, next(hashes), converted) for item, _, converted in bucket ]
+		for bucket in buckets)
+
+
+def encode_entries( header, shift, entries ):
+	"""Encodes a bucket from its entries (see 'make_entries').
+
+	If the header requests fingerprints they're derived from the entry hashes
+	with the lowest fingerprint bit at 'shift'. Picklers that encode buckets as
+	records then get the converted items in ascending byte order, which is the
+	order of sorted layouts, too, so that the fingerprints line up with the
+	stored entries.
+	"""
+
+	pickler = header.pickler
+	join = getattr(pickler, 'join_bucket', None)
+	size = header.fingerprint_size
+	if size and join is not None:
+		entries = sorted(entries, key=lambda e: bytes(e[2]))
+
+	if join is not None:
+		data = join([ e[2] for e in entries ])
+	else:
+		data = pickler.dump_bucket([ e[0] for e in entries ])
+
+	if size:
+		data = fingerprint.join(
+			[ fingerprint.of(e[1], size, shift) for e in entries ], size, data)
+	return data
+
+
+
+def write( file, header, bucket_sizes, buckets, value_size=None, bloom=None,
+	mph=None, block_size=1<<16
+):
+	"""Writes a hash set file.
+
+	'bucket_sizes' are the sizes of all encoded buckets and 'buckets' the
+	encoded non-empty buckets, both in bucket order. Either may be an iterator.
+	If the header has no 'int_size' yet, it's derived from 'value_size', the
+	total of all bucket sizes. 'bloom' is the Bloom filter and 'mph' the minimal
+	perfect hash table requested by the header, if any. If the header requests
+	compression the buckets are compressed in blocks of about 'block_size'
+	bytes.
+	"""
+
+	buf = header.to_bytes(value_size=value_size)
+	if bloom is not None:
+		offset = header.bloom_offset()
+		assert len(bloom.buf) == header.bloom_size()
+		buf[offset : offset + len(bloom.buf)] = bloom.buf
+	if mph is not None:
+		offset = header.mph_offset()
+		table = memoryview(mph.displacements).cast('B')
+		assert len(table) == header.mph_size()
+		buf[offset : offset + len(table)] = table
+	file.write(buf)
+
+	offsets = itertools.islice(
+		util_iter.accumulate(bucket_sizes, 0), header.bucket_count)
+	util_iter.each(file.write,
+		map(b''.join, util_iter.chunked(map(header.int_to_bytes, offsets), 1<<12)))
+	if header.compression:
+		compression.write_blocks(file, buckets, header.compression, block_size)
+	else:
+		util_iter.each(file.write, buckets)